@@ -1,232 +1,440 @@
-import time
-import threading
-import sys
+import array
+import collections
+import queue
 import random
+import threading
+
+from backends import create_backend
+from calibrate import output_cost
+from eventlog import LOG_EVENTS, LOG_SUMMARY, LOOP, PROGRESS, TRACK, EventLog
+from humanize import Humanizer
+from realtime import GCPaused, lock_memory, normal_priority, pin_cpus, set_realtime
+from telemetry import Telemetry
+from timing import SYSTEM_CLOCK, make_wait_strategy
+from timeline import (SPECIAL_CHARACTERS, SheetStream, TempoMap, Timeline, get_score, get_timeline, iter_frames,
+                      render)
+
+
+def _dispatch_worker(jobs, priority, cpus, lock):
+    """Body of the player's dispatch thread: set itself up once, then run jobs.
+
+    Only this thread is raised to SCHED_FIFO / pinned, so the GUI, hotkey
+    listener and log drain keep running at normal priority. It holds no
+    reference to the player between jobs; None shuts it down.
+    """
+    if lock:
+        lock_memory()
+    if cpus:
+        pin_cpus(cpus)
+    if priority:
+        set_realtime(priority)
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        job()
+        del job
+
+
+class _Wake:
+    """Stop flag for the dispatcher's waits that also trips on a tempo change.
 
-# Backend selection
-try:
-    import evdev
-    from evdev import UInput, ecodes as e
-    LINUX_EVDEV = True
-except ImportError:
-    LINUX_EVDEV = False
+    The wait strategies poll is_set() between sleeps, so a set_delay() made
+    during a wait ends it early and the frame's time is computed again on
+    the new tempo map.
+    """
+    __slots__ = ('stop_event', 'retimes', 'seen')
+
+    def __init__(self, stop_event):
+        self.stop_event = stop_event
+        self.retimes = 0  # bumped by every tempo change during playback
+        self.seen = 0     # value of retimes when the current wait began
+
+    def is_set(self):
+        return self.retimes != self.seen or self.stop_event.is_set()
+
+
+class QueuedSheet:
+    """A sheet waiting in the player's playlist; compiled while the song before it plays."""
+
+    def __init__(self, sheet_content, delay=None, hold_percent=None, title=None):
+        self.sheet_content = sheet_content
+        self.delay = delay                # None keeps the current tempo
+        self.hold_percent = hold_percent  # None keeps the current hold
+        self.title = title
+        self.worker = None                # (thread, result) once compiling
 
-from pynput.keyboard import Controller, Key
 
 class PianoPlayer:
-    def __init__(self, delay=0.095, hold_percent=0.8, humanize=False):
+    def __init__(self, delay=0.095, hold_percent=0.8, humanize=False, streaming=False, verbosity=LOG_EVENTS,
+                 wait='hybrid', backend=None, clock=None, rng=None, realtime=0, cpus=None, lock_memory=False,
+                 stop_event=None, humanizer=None, compensate=True):
         self.delay = delay
         self.hold_percent = hold_percent
         self.humanize = humanize
-        self._stop_event = threading.Event()
-        self.ui = None
-        
-        # Initialize backend
-        if LINUX_EVDEV and sys.platform.startswith('linux'):
-            try:
-                self.ui = UInput()
-                self.backend = 'evdev'
-                print(f"[LOG] Backend: evdev (Wayland Support)")
-            except Exception as err:
-                print(f"[LOG] evdev failed: {err}. Falling back to pynput.")
-                self.keyboard = Controller()
-                self.backend = 'pynput'
-        else:
-            self.keyboard = Controller()
-            self.backend = 'pynput'
-            print(f"[LOG] Backend: pynput")
-
-        self.special_characters = {
-            '!': '1', '@': '2', '#': '3', '$': '4', '%': '5',
-            '^': '6', '&': '7', '*': '8', '(': '9', ')': '0',
-            '_': '-', '+': '=', '{': '[', '}': ']', ':': ';',
-            '"': "'", '<': ',', '>': '.', '?': '/'
-        }
+        self.streaming = streaming
+        self.loop = False
+        # Playlist: songs that follow the current one on the same timeline,
+        # separated by `gap` seconds of silence
+        self.queue = collections.deque()
+        self.gap = 0.0
+        self._queue_lock = threading.Lock()
+        # Beats -> seconds for the current run; retimed live by set_delay
+        self.tempo = TempoMap(delay)
+        self._start_time = None
+        # Injectable time source and humanize randomness (VirtualClock and a
+        # seeded random.Random or Humanizer give fast, reproducible runs)
+        self.clock = clock or SYSTEM_CLOCK
+        self.rng = rng or random
+        # Humanize distributions; used whenever `humanize` is on
+        self.humanizer = humanizer or Humanizer(rng=self.rng)
+        self.log = EventLog(verbosity)
+        self.wait_strategy = make_wait_strategy(wait, self.clock)
+        self.telemetry = Telemetry()  # timings of the most recent run
+        # Anything with is_set()/set()/clear(); the engine process shares one
+        self._stop_event = stop_event or threading.Event()
+        self._wake = _Wake(self._stop_event)
+        # Live progress of the current run: [events sent this pass, pass number, queued songs started]
+        self.progress = array.array('q', bytes(24))
+        self.output = None
+
+        # Dispatch thread settings: SCHED_FIFO priority (0 = normal),
+        # CPUs to pin it to, and whether to mlockall() the process
+        self.realtime = realtime
+        self.cpus = cpus
+        self.lock_memory = lock_memory
+        self._jobs = queue.Queue()
+        self._dispatch_thread = None
         
-        # Scancode mapping for Linux evdev
-        if hasattr(self, 'backend') and self.backend == 'evdev':
-            self.key_map = {
-                '1': e.KEY_1, '2': e.KEY_2, '3': e.KEY_3, '4': e.KEY_4, '5': e.KEY_5,
-                '6': e.KEY_6, '7': e.KEY_7, '8': e.KEY_8, '9': e.KEY_9, '0': e.KEY_0,
-                'a': e.KEY_A, 'b': e.KEY_B, 'c': e.KEY_C, 'd': e.KEY_D, 'e': e.KEY_E,
-                'f': e.KEY_F, 'g': e.KEY_G, 'h': e.KEY_H, 'i': e.KEY_I, 'j': e.KEY_J,
-                'k': e.KEY_K, 'l': e.KEY_L, 'm': e.KEY_M, 'n': e.KEY_N, 'o': e.KEY_O,
-                'p': e.KEY_P, 'q': e.KEY_Q, 'r': e.KEY_R, 's': e.KEY_S, 't': e.KEY_T,
-                'u': e.KEY_U, 'v': e.KEY_V, 'w': e.KEY_W, 'x': e.KEY_X, 'y': e.KEY_Y,
-                'z': e.KEY_Z,
-                '-': e.KEY_MINUS, '=': e.KEY_EQUAL, '[': e.KEY_LEFTBRACE, ']': e.KEY_RIGHTBRACE,
-                ';': e.KEY_SEMICOLON, "'": e.KEY_APOSTROPHE, ',': e.KEY_COMMA, '.': e.KEY_DOT,
-                '/': e.KEY_SLASH
-            }
+        # Initialize backend: evdev/pynput by default, or 'null'/'recording'
+        self.output = create_backend(backend, self.clock)
+        self.backend = self.output.name
+        # Measured send cost of the backend (see calibrate.py); frames go
+        # out that much early so they land on time. A simulated clock never
+        # pays it, so virtual runs stay exact and independent of the profile
+        self.compensate = compensate and not self.clock.virtual
+        self.output_cost = output_cost(self.backend) if self.compensate else None
+        if self.output_cost is not None:
+            print(f"[LOG] Output lead: {self.output_cost}")
+
+        self.special_characters = SPECIAL_CHARACTERS
 
     def __del__(self):
         """Cleanup resources."""
-        if self.ui:
+        self.close()
+
+    def close(self):
+        """Stop the dispatch thread and release the output device."""
+        thread = self._dispatch_thread
+        if thread is not None:
+            self._jobs.put(None)
+            self._dispatch_thread = None
+            # Let a stopped performance finish (and release shift) first
+            if thread is not threading.current_thread():
+                thread.join(timeout=1)
+        if self.output:
             try:
-                self.ui.close()
-                print("[LOG] evdev UInput closed.")
+                self.output.close()
             except:
                 pass
+            self.output = None
 
-    def _send_key_event(self, note, is_press):
-        """Non-blocking key event sender with verbose logging."""
-        action = "PRESS" if is_press else "RELEASE"
-        print(f"[VERBOSE] {action}: {note}")
-        
-        if self.backend == 'evdev':
-            self._send_evdev(note, is_press)
-        else:
-            self._send_pynput(note, is_press)
-
-    def _send_pynput(self, note, is_press):
-        char = note
-        needs_shift = False
-        if note in self.special_characters:
-            char = self.special_characters[note]
-            needs_shift = True
-        elif note.isupper():
-            char = note.lower()
-            needs_shift = True
-
-        if is_press:
-            if needs_shift: self.keyboard.press(Key.shift)
-            self.keyboard.press(char)
+    def _resolve_note(self, note):
+        """Map a sheet character to a backend-native (code, needs_shift) pair."""
+        return self.output.notes.get(note)
+
+    def compile(self, sheet_content):
+        """Compile (or fetch from cache) the timeline for the current settings."""
+        return get_timeline(sheet_content, self.delay, self.hold_percent, self._humanizer(),
+                            self._resolve_note, self.backend)
+
+    def _send_frame(self, frame, scheduled, output=None):
+        """Send every event of one scheduled instant and record when each went out."""
+        output = output or self.output
+        telemetry = self.telemetry
+        now = self.clock.now
+        if output.batched:
+            output.send_frame(frame)
+            telemetry.record(scheduled, now(), len(frame))
         else:
-            self.keyboard.release(char)
-            if needs_shift: self.keyboard.release(Key.shift)
-
-    def _send_evdev(self, note, is_press):
-        char = note
-        needs_shift = False
-        if note in self.special_characters:
-            char = self.special_characters[note]
-            needs_shift = True
-        elif note.isupper():
-            char = note.lower()
-            needs_shift = True
-
-        code = self.key_map.get(char)
-        if code:
-            if is_press:
-                if needs_shift:
-                    self.ui.write(e.EV_KEY, e.KEY_LEFTSHIFT, 1)
-                    self.ui.syn() # Separate sync for shift press
-                self.ui.write(e.EV_KEY, code, 1)
-            else:
-                self.ui.write(e.EV_KEY, code, 0)
-                if needs_shift:
-                    self.ui.syn() # Ensure key release is synced before shift release
-                    self.ui.write(e.EV_KEY, e.KEY_LEFTSHIFT, 0)
-            self.ui.syn()
+            for code, needs_shift, action in frame:
+                output.send_event(code, needs_shift, action)
+                telemetry.record(scheduled, now())
 
     def stop(self):
         self._stop_event.set()
 
+    def set_verbosity(self, verbosity):
+        """Select the log level: 'off', 'summary' or 'events'."""
+        self.log.set_verbosity(verbosity)
+
+    def set_wait_strategy(self, wait):
+        """Select the timing engine: 'hybrid', 'deadline' or 'sleep'."""
+        self.wait_strategy = make_wait_strategy(wait, self.clock)
+
     def _wait_until(self, target_time):
-        """High-precision spin-wait loop."""
-        while time.perf_counter() < target_time:
+        return self.wait_strategy.wait_until(target_time, self._stop_event)
+
+    def _wait_for_beat(self, start_time, beat, lead=0.0):
+        """Wait until `lead` seconds before `beat`; returns its time, or None if stopped.
+
+        A tempo change during the wait interrupts it, and the deadline is
+        recomputed on the new tempo map.
+        """
+        wake = self._wake
+        seconds = self.tempo.seconds
+        while True:
+            wake.seen = wake.retimes
+            target = start_time + seconds(beat)
+            if self.wait_strategy.wait_until(target - lead, wake):
+                return target
             if self._stop_event.is_set():
+                return None
+
+    def _retimed(self):
+        """Wake the dispatcher so it re-times the frame it is waiting for."""
+        self._wake.retimes += 1
+
+    def events(self, sheet_content, streaming=None):
+        """Time-ordered events for a sheet: a cached Timeline, or a lazy SheetStream."""
+        if streaming is None:
+            streaming = self.streaming
+        if streaming:
+            return SheetStream(sheet_content, self.delay, self.hold_percent, self._humanizer(), self._resolve_note)
+        return self.compile(sheet_content)
+
+    def _run_on_dispatch_thread(self, func, *args):
+        """Run func(*args) on the dispatch thread and wait for its result."""
+        if self._dispatch_thread is None:
+            self._dispatch_thread = threading.Thread(
+                target=_dispatch_worker, args=(self._jobs, self.realtime, self.cpus, self.lock_memory),
+                name="autoblox-dispatch", daemon=True)
+            self._dispatch_thread.start()
+        done = threading.Event()
+        result = {}
+        def job():
+            try:
+                result['value'] = func(*args)
+            except BaseException as err:
+                result['error'] = err
+            finally:
+                done.set()
+        self._jobs.put(job)
+        done.wait()
+        if 'error' in result:
+            raise result['error']
+        return result.get('value')
+
+    def _humanizer(self):
+        return self.humanizer if self.humanize else None
+
+    def _prepare(self, sheet_content, delay, hold_percent, humanizer):
+        """Render a timeline on a worker thread (a fresh humanized variant, or a queued song).
+
+        The sheet's Score is parsed once and cached, so a new variant only
+        costs a render. Returns (thread, result); result['timeline'] is set
+        once the thread ends.
+        """
+        result = {}
+        def work():
+            # Started from the dispatch thread, so shed its real-time policy
+            normal_priority()
+            score = get_score(sheet_content, self._resolve_note, self.backend)
+            result['timeline'] = render(score, delay, hold_percent, humanizer)
+        worker = threading.Thread(target=work, daemon=True)
+        worker.start()
+        return worker, result
+
+    def enqueue(self, sheet_content, delay=None, hold_percent=None, title=None):
+        """Add a song to the playlist; during playback it starts compiling at once if it is next."""
+        with self._queue_lock:
+            self.queue.append(QueuedSheet(sheet_content, delay, hold_percent, title))
+        if self._start_time is not None:
+            self._prefetch()
+
+    def clear_queue(self):
+        with self._queue_lock:
+            self.queue.clear()
+
+    def _prefetch(self):
+        """Start compiling the next queued song, if it is not already."""
+        with self._queue_lock:
+            if not self.queue or self.queue[0].worker is not None:
+                return
+            item = self.queue[0]
+            item.worker = self._prepare(item.sheet_content, item.delay or self.delay,
+                                        item.hold_percent or self.hold_percent, self._humanizer())
+
+    def _next_queued(self):
+        """Pop the next queued song and return it with its timeline (normally ready by now)."""
+        self._prefetch()
+        with self._queue_lock:
+            item = self.queue.popleft()
+        worker, result = item.worker
+        worker.join()
+        return item, result['timeline']
+
+    def set_delay(self, delay):
+        """Change the tempo (seconds per beat); takes effect at once during playback."""
+        self.delay = delay
+        if self._start_time is not None:
+            tempo = self.tempo
+            tempo.set_delay(delay, tempo.beat_at(self.clock.now() - self._start_time))
+            self._retimed()
+
+    def _hold(self):
+        return self.hold_percent
+
+    def _dispatch(self, events, start_time, count, beat_offset):
+        """Send one pass of events against `start_time`; False if stopped."""
+        log = self.log
+        log_events = log.verbosity >= LOG_EVENTS
+        log_summary = log.verbosity >= LOG_SUMMARY
+        record = log.record
+        progress = self.progress
+        output = self.output
+        cost = self.output_cost
+
+        # Each pass starts at the user's tempo; tempo marks take over from there
+        tempo = self.tempo
+        tempo.set_delay(self.delay, beat_offset)
+
+        sent = 0
+        for i, (beat, frame) in enumerate(iter_frames(events, tempo, self._hold, beat_offset)):
+            target = self._wait_for_beat(start_time, beat, cost.lead(output, frame) if cost is not None else 0.0)
+            if target is None:
                 return False
-            diff = target_time - time.perf_counter()
-            if diff > 0.002:
-                time.sleep(0.001)
+            ts = target - start_time
+
+            self._send_frame(frame, target)
+
+            if log_events:
+                for code, needs_shift, action in frame:
+                    record(action, code, needs_shift, ts)
+            # Periodic heartbeat every 10 frames
+            elif log_summary and i % 10 == 0:
+                record(PROGRESS, sent, count, ts)
+            sent += len(frame)
+            progress[0] = sent
         return True
 
-    def play(self, sheet_content):
+    def play(self, sheet_content, streaming=None, loop=None, timeline=None):
+        """Play a sheet; with loop (default: self.loop) repeat it gaplessly until stopped.
+
+        `timeline` is an already compiled Timeline of the sheet (for example
+        one mapped from shared memory) to play instead of compiling it here.
+
+        The sheet is compiled on the calling thread; the timed part runs on
+        the player's dedicated dispatch thread, with the cyclic garbage
+        collector paused, and play() returns when it is done.
+        """
         self._stop_event.clear()
+        self.wait_strategy.stats.reset()
+        log = self.log
+        if streaming is None:
+            streaming = self.streaming
         
-        # Pre-process: Create a flat list of events (time, type, note)
-        events = [] # List of (timestamp, type, note)
-        current_time = 0.0
-        index = 0
-        notes = sheet_content
-
-        while index < len(notes):
-            char = notes[index]
-            
-            # Sanitization: Ignore spaces and bar lines as timing units
-            if char.isspace() or char == '|':
-                index += 1
-                continue
-
-            if char.isalnum() or char in self.special_characters:
-                # SINGLE NOTE
-                self._schedule_note(events, current_time, char)
-                current_time += self.delay
-            elif char == '[':
-                # CHORD
-                chord_notes = []
-                index += 1
-                while index < len(notes) and notes[index] != ']':
-                    if not notes[index].isspace() and (notes[index].isalnum() or notes[index] in self.special_characters):
-                        chord_notes.append(notes[index])
-                    index += 1
-                
-                # Schedule chord with micro-offsets if humanized
-                for i, chord_note in enumerate(chord_notes):
-                    offset = 0
-                    if self.humanize:
-                        offset = i * random.uniform(0.005, 0.012)
-                    self._schedule_note(events, current_time + offset, chord_note)
-                
-                current_time += self.delay
-            index += 1
-
-        # Sort events by time
-        events.sort(key=lambda x: x[0])
-        
-        total_duration = events[-1][0] if events else 0
-        print(f"[LOG] Playback System | Humanize: {'ON' if self.humanize else 'OFF'}")
-        print(f"[LOG] Sequence: {len(events)} events | Estimated Duration: {total_duration:.2f}s")
-
-        start_time = time.perf_counter()
-        for i, (ts, action, note) in enumerate(events):
-            if not self._wait_until(start_time + ts):
-                break
-            
-            # Periodic heartbeat log every 10 events
-            if i % 10 == 0:
-                print(f"[LOG] Playing event {i}/{len(events)} (Time: {ts:.2f}s / {total_duration:.2f}s)")
-
-            is_press = (action == "press")
-            self._send_key_event(note, is_press)
-
-        # SEAMLESS LOGIC: Wait until the very end of the last beat before returning
-        # This ensures the next loop starts exactly on time.
-        self._wait_until(start_time + current_time)
-
-        print("[LOG] Playback finished or stopped.")
-
-    def _schedule_note(self, event_list, startTime, note):
-        """Calculate press and release times for a note."""
-        jitter = 0
-        if self.humanize:
-            jitter = random.uniform(-0.005, 0.005)
-        
-        press_time = startTime + jitter
-        
-        # Duration calculation
-        duration = self.delay * self.hold_percent
-        if self.humanize:
-            duration *= random.uniform(0.9, 1.1)
+        # Compiled mode hits the cache on replays; streaming mode starts
+        # dispatching while the rest of the sheet is still being parsed
+        events = timeline if timeline is not None else self.events(sheet_content, streaming)
         
-        duration = max(0.015, duration) # Safety minimum
-        
-        # Release humanization (slight offset for release)
-        release_jitter = 0
-        if self.humanize:
-            release_jitter = random.uniform(0, 0.01)
+        log.info(f"[LOG] Playback System | Humanize: {'ON' if self.humanize else 'OFF'}")
+        if isinstance(events, Timeline):
+            count = len(events)
+            log.info(f"[LOG] Sequence: {count} events | Estimated Duration: {events.duration(self.delay):.2f}s")
+            if events.unknown:
+                log.info(f"[LOG] Unknown symbols skipped: {' '.join(events.unknown)}")
+        else:
+            count = -1
+            log.info(f"[LOG] Sequence: streaming")
+        if self.queue:
+            log.info(f"[LOG] Queue: {len(self.queue)} more after this")
 
-        release_time = press_time + duration + release_jitter
-        
-        event_list.append((press_time, "press", note))
-        event_list.append((release_time, "release", note))
+        # The timed loop only stores numbers in the ring buffer; the drain
+        # thread formats and prints them
+        if log.verbosity >= LOG_SUMMARY:
+            log.start()
+
+        self._run_on_dispatch_thread(self._perform, sheet_content, events, count, streaming, loop)
+
+        if isinstance(events, SheetStream) and events.unknown:
+            log.info(f"[LOG] Unknown symbols skipped: {' '.join(events.unknown)}")
+        log.info(f"[LOG] Timing ({self.wait_strategy.name}): {self.wait_strategy.stats}")
+        log.info(f"[LOG] Jitter: {self.telemetry.report()}")
+        log.info("[LOG] Playback finished or stopped.")
+
+    def _perform(self, sheet_content, events, count, streaming, loop):
+        """The timed playback loop; runs on the dispatch thread.
+
+        Every pass is scheduled on one absolute timeline: pass N starts at
+        start_time plus the summed lengths of the passes before it, so
+        wake-up error never accumulates between repeats. Humanized variants
+        of the next pass are compiled on a worker thread while the current
+        one plays.
+        """
+        with GCPaused():
+            log = self.log
+            start_time = self.clock.now()
+            self.telemetry = Telemetry(count if count > 0 else 4096, start_time)
+            self.tempo.reset(self.delay)
+            self._start_time = start_time
+            beat_offset = 0.0
+            iteration = 0
+            tracks = 0
+            self.progress[0] = 0
+            self.progress[1] = 0
+            self.progress[2] = 0
+            while True:
+                looping = self.loop if loop is None else loop
+                # While this pass plays, compile the next queued song, or
+                # else a new humanized variant of this one
+                self._prefetch()
+                variant = None
+                if not self.queue and looping and self.humanize and not streaming:
+                    variant = self._prepare(sheet_content, self.delay, self.hold_percent, self.humanizer)
+
+                if not self._dispatch(events, start_time, count, beat_offset):
+                    break
+                # Whatever comes next starts exactly where this pass's last beat ends
+                beat_offset += events.end_beat
+
+                if self.queue:
+                    item, events = self._next_queued()
+                    sheet_content = item.sheet_content
+                    streaming = False
+                    count = len(events)
+                    if item.delay:
+                        self.delay = item.delay
+                    if item.hold_percent:
+                        self.hold_percent = item.hold_percent
+                    # The gap is silence at the tempo the last song ended on
+                    beat_offset += self.gap / self.tempo.delay
+                    tracks += 1
+                    self.progress[2] = tracks
+                    if log.verbosity >= LOG_SUMMARY:
+                        log.record(TRACK, tracks, len(self.queue), self.tempo.seconds(beat_offset))
+                    continue
+
+                if not (self.loop if loop is None else loop):
+                    # SEAMLESS LOGIC: Wait until the very end of the last beat before returning
+                    self._wait_for_beat(start_time, beat_offset)
+                    break
+
+                iteration += 1
+                self.progress[1] = iteration
+                if log.verbosity >= LOG_SUMMARY:
+                    log.record(LOOP, iteration, 0, self.tempo.seconds(beat_offset))
+                if streaming:
+                    events = self.events(sheet_content, streaming)
+                elif variant is not None:
+                    worker, result = variant
+                    worker.join()
+                    events = result['timeline']
+            self._start_time = None
+        # Shift may still be held from the last shifted note
+        self.output.release_modifiers()
 
 if __name__ == "__main__":
-    player = PianoPlayer()
-    try:
-        with open('sheet.txt') as f:
-            content = f.read()
-            player.play(content)
-    except FileNotFoundError:
-        print("[ERR] sheet.txt not found.")
+    # Kept for compatibility: plays sheet.txt through the CLI
+    from cli import main
+    main(['sheet.txt'])
@@ -0,0 +1,237 @@
+import sys
+
+# Backend selection. pynput is only imported when its backend is created,
+# so headless evdev runs never load it (or an X connection)
+try:
+    import evdev
+    from evdev import UInput, ecodes as e
+    LINUX_EVDEV = True
+except ImportError:
+    LINUX_EVDEV = False
+
+from timeline import PRESS, SPECIAL_CHARACTERS
+from timing import SYSTEM_CLOCK
+
+# Stands in for the shift key in planned frame operations
+SHIFT = -1
+
+# Every unshifted key a note can land on
+BASE_KEYS = "1234567890abcdefghijklmnopqrstuvwxyz-=[];',./"
+
+
+def build_note_table(code_for):
+    """Map every playable note character to (code, needs_shift), given base key -> code."""
+    table = {}
+    for char in BASE_KEYS:
+        table[char] = (code_for[char], False)
+        if char.isalpha():
+            table[char.upper()] = (code_for[char], True)
+    for note, char in SPECIAL_CHARACTERS.items():
+        table[note] = (code_for[char], True)
+    return table
+
+
+# Generic codes (the base key's code point), used by the null and recording backends
+GENERIC_NOTES = build_note_table({char: ord(char) for char in BASE_KEYS})
+
+# Scancode mapping for Linux evdev
+if LINUX_EVDEV:
+    EVDEV_KEYS = {
+        '1': e.KEY_1, '2': e.KEY_2, '3': e.KEY_3, '4': e.KEY_4, '5': e.KEY_5,
+        '6': e.KEY_6, '7': e.KEY_7, '8': e.KEY_8, '9': e.KEY_9, '0': e.KEY_0,
+        'a': e.KEY_A, 'b': e.KEY_B, 'c': e.KEY_C, 'd': e.KEY_D, 'e': e.KEY_E,
+        'f': e.KEY_F, 'g': e.KEY_G, 'h': e.KEY_H, 'i': e.KEY_I, 'j': e.KEY_J,
+        'k': e.KEY_K, 'l': e.KEY_L, 'm': e.KEY_M, 'n': e.KEY_N, 'o': e.KEY_O,
+        'p': e.KEY_P, 'q': e.KEY_Q, 'r': e.KEY_R, 's': e.KEY_S, 't': e.KEY_T,
+        'u': e.KEY_U, 'v': e.KEY_V, 'w': e.KEY_W, 'x': e.KEY_X, 'y': e.KEY_Y,
+        'z': e.KEY_Z,
+        '-': e.KEY_MINUS, '=': e.KEY_EQUAL, '[': e.KEY_LEFTBRACE, ']': e.KEY_RIGHTBRACE,
+        ';': e.KEY_SEMICOLON, "'": e.KEY_APOSTROPHE, ',': e.KEY_COMMA, '.': e.KEY_DOT,
+        '/': e.KEY_SLASH
+    }
+    EVDEV_NOTES = build_note_table(EVDEV_KEYS)
+else:
+    EVDEV_NOTES = {}
+
+# pynput codes index a table of KeyCode objects built with the backend
+PYNPUT_NOTES = build_note_table({char: i for i, char in enumerate(BASE_KEYS)})
+
+
+class Backend:
+    """Key output device. Frames are lists of (code, needs_shift, action).
+
+    `notes` is the backend's module-level note -> (code, needs_shift) table;
+    sheets are resolved against it once, at compile time.
+    """
+    name = None
+    notes = GENERIC_NOTES
+    # True if send_frame() delivers a whole frame at once; otherwise the
+    # player calls send_event() per event and timestamps each one
+    batched = True
+    # Whether our shift key is currently down
+    shift_held = False
+    # A key no game reacts to, pressed only by calibration
+    probe_code = 0
+
+    def plan_frame(self, frame):
+        """Order a frame's key transitions as (code or SHIFT, value) pairs.
+
+        Shift only matters at the moment a key goes down, so it is not tied
+        to note releases: it stays held across consecutive shifted presses
+        and changes only when a press needs the other state. Releases go
+        first, then presses that match the current shift state, then a
+        single shift transition and the remaining presses.
+        """
+        held = self.shift_held
+        ops = []
+        flipped = []
+        for code, needs_shift, action in frame:
+            if action != PRESS:
+                ops.append((code, 0))
+            elif bool(needs_shift) == held:
+                ops.append((code, 1))
+            else:
+                flipped.append(code)
+        if flipped:
+            held = not held
+            ops.append((SHIFT, int(held)))
+            ops.extend((code, 1) for code in flipped)
+        self.shift_held = held
+        return ops
+
+    def writes(self, frame):
+        """Key transitions sending `frame` would take, counting a shift change; sends nothing."""
+        held = self.shift_held
+        for code, needs_shift, action in frame:
+            if action == PRESS and bool(needs_shift) != held:
+                return len(frame) + 1
+        return len(frame)
+
+    def send_event(self, code, needs_shift, action):
+        raise NotImplementedError
+
+    def send_frame(self, frame):
+        for code, needs_shift, action in frame:
+            self.send_event(code, needs_shift, action)
+
+    def release_modifiers(self):
+        """Let go of shift at the end of playback."""
+        self.shift_held = False
+
+    def close(self):
+        pass
+
+
+class EvdevBackend(Backend):
+    """Virtual uinput keyboard; works under Wayland."""
+    name = 'evdev'
+    notes = EVDEV_NOTES
+    probe_code = e.KEY_F24 if LINUX_EVDEV else 0
+
+    def __init__(self):
+        self.ui = UInput()
+
+    def send_frame(self, frame):
+        """Write a whole frame and close it with a single SYN_REPORT.
+
+        Consumers apply the events of one report in order, so a shift
+        transition placed before a key takes effect for that key; the chord
+        arrives as one atomic input frame instead of one per note.
+        """
+        write = self.ui.write
+        for code, value in self.plan_frame(frame):
+            write(e.EV_KEY, e.KEY_LEFTSHIFT if code == SHIFT else code, value)
+        self.ui.syn()
+
+    def release_modifiers(self):
+        if self.shift_held:
+            self.ui.write(e.EV_KEY, e.KEY_LEFTSHIFT, 0)
+            self.ui.syn()
+        self.shift_held = False
+
+    def close(self):
+        self.ui.close()
+        print("[LOG] evdev UInput closed.")
+
+
+class PynputBackend(Backend):
+    """X11 / generic keyboard injection through pynput."""
+    name = 'pynput'
+    notes = PYNPUT_NOTES
+    batched = False
+
+    def __init__(self):
+        from pynput.keyboard import Controller, Key, KeyCode
+        self.keyboard = Controller()
+        self.shift = Key.shift
+        self.keycodes = [KeyCode.from_char(char) for char in BASE_KEYS]
+        # Calibration probe: a function key past every note
+        self.probe_code = len(self.keycodes)
+        self.keycodes.append(Key.f20)
+
+    def send_event(self, code, needs_shift, action):
+        key = self.keycodes[code]
+        if action == PRESS:
+            if bool(needs_shift) != self.shift_held:
+                self.shift_held = not self.shift_held
+                if self.shift_held: self.keyboard.press(self.shift)
+                else: self.keyboard.release(self.shift)
+            self.keyboard.press(key)
+        else:
+            self.keyboard.release(key)
+
+    def release_modifiers(self):
+        if self.shift_held:
+            self.keyboard.release(self.shift)
+        self.shift_held = False
+
+
+class NullBackend(Backend):
+    """Discards all output; for benchmarks and headless runs."""
+    name = 'null'
+
+    def send_frame(self, frame):
+        pass
+
+
+class RecordingBackend(Backend):
+    """Keeps every frame in memory as (time, code, needs_shift, action) tuples."""
+    name = 'recording'
+
+    def __init__(self, clock=None):
+        self.clock = (clock or SYSTEM_CLOCK).now
+        self.events = []
+
+    def send_frame(self, frame):
+        now = self.clock()
+        self.events.extend((now, code, needs_shift, action) for code, needs_shift, action in frame)
+
+    def clear(self):
+        self.events.clear()
+
+
+BACKENDS = {cls.name: cls for cls in (EvdevBackend, PynputBackend, NullBackend, RecordingBackend)}
+
+
+def create_backend(name=None, clock=None):
+    """Create an output backend by name; None picks evdev when available, else pynput."""
+    if isinstance(name, Backend):
+        return name
+    if name is None:
+        if LINUX_EVDEV and sys.platform.startswith('linux'):
+            try:
+                backend = EvdevBackend()
+                print(f"[LOG] Backend: evdev (Wayland Support)")
+                return backend
+            except Exception as err:
+                print(f"[LOG] evdev failed: {err}. Falling back to pynput.")
+                return PynputBackend()
+        print(f"[LOG] Backend: pynput")
+        return PynputBackend()
+    try:
+        cls = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown backend: {name!r} (choose from {', '.join(BACKENDS)})")
+    backend = cls(clock) if cls is RecordingBackend else cls()
+    print(f"[LOG] Backend: {backend.name}")
+    return backend
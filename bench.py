@@ -0,0 +1,121 @@
+"""Benchmarks for the compile and dispatch paths.
+
+Runs headless against the null output backend:
+
+    python bench.py
+    python bench.py --sizes 1000 10000 --jitter-notes 400
+"""
+import argparse
+import random
+import threading
+import time
+import tracemalloc
+
+from auto import PianoPlayer
+from timeline import compile_sheet
+
+WHITE = "1234567890qwertyuiopasdfghjklzxcvbnm"
+BLACK = "!@$%^*(QWETYIOPSDGHJLZCVB"
+
+TRACE_LIMIT = 100000
+
+
+def make_sheet(notes, seed=0):
+    """Synthetic sheet with roughly `notes` notes: single notes, chords and shifted keys."""
+    rng = random.Random(seed)
+    keys = WHITE + BLACK
+    parts = []
+    written = 0
+    while written < notes:
+        if rng.random() < 0.3:
+            size = min(rng.randint(2, 4), notes - written)
+            parts.append("[" + "".join(rng.choice(keys) for _ in range(size)) + "]")
+            written += size
+        else:
+            parts.append(rng.choice(keys))
+            written += 1
+        if len(parts) % 16 == 0:
+            parts.append("\n")
+    return " ".join(parts)
+
+
+def bench_compile(player, sizes):
+    print("[BENCH] Compile throughput")
+    for humanize in (False, True):
+        for n in sizes:
+            sheet = make_sheet(n)
+            t0 = time.perf_counter()
+            timeline = compile_sheet(sheet, 0.1, 0.8, humanize, player.output.notes.get)
+            elapsed = time.perf_counter() - t0
+            events = len(timeline)
+
+            # tracemalloc slows allocation-heavy code a lot, so measure the
+            # compile's peak memory in a separate pass on the smaller sheets
+            peak = ""
+            if n <= TRACE_LIMIT:
+                tracemalloc.start()
+                compile_sheet(sheet, 0.1, 0.8, humanize, player.output.notes.get)
+                peak = f" | {tracemalloc.get_traced_memory()[1] / events:.1f} B/event peak"
+                tracemalloc.stop()
+            print(f"  humanize={'on ' if humanize else 'off'} notes={n:>8} | {elapsed:8.3f}s | "
+                  f"{n / elapsed:>10.0f} notes/s | {timeline.nbytes() / events:.1f} B/event stored{peak}")
+
+
+def bench_dispatch(player, notes):
+    print("[BENCH] Dispatch overhead (no waiting, null backend)")
+    sheet = make_sheet(notes)
+    for humanize in (False, True):
+        player.humanize = humanize
+        # A 1us beat puts every event in the past, so waits return at once
+        player.delay = 1e-6
+        # Humanized renders are not cached, so play the compiled timeline itself
+        timeline = player.compile(sheet)
+        events = len(timeline)
+        t0 = time.perf_counter()
+        player.play(sheet, timeline=timeline)
+        elapsed = time.perf_counter() - t0
+        print(f"  humanize={'on ' if humanize else 'off'} events={events:>8} | {elapsed / events * 1e6:.2f}us/event")
+
+
+def _load(stop):
+    # Pure-Python busy loop: competes for the GIL like a GUI repaint would
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def bench_jitter(player, notes, delay):
+    print(f"[BENCH] Timing jitter ({player.wait_strategy.name} wait, {delay * 1000:.0f}ms beat)")
+    sheet = make_sheet(notes)
+    for load in (False, True):
+        for humanize in (False, True):
+            player.humanize = humanize
+            player.delay = delay
+            stop = threading.Event()
+            if load:
+                threading.Thread(target=_load, args=(stop,), daemon=True).start()
+            player.play(sheet)
+            stop.set()
+            s = player.telemetry.summary()
+            print(f"  load={'on ' if load else 'off'} humanize={'on ' if humanize else 'off'} | "
+                  f"p50 {s['p50'] * 1e6:6.0f}us p99 {s['p99'] * 1e6:6.0f}us max {s['max'] * 1e6:6.0f}us | "
+                  f"chord spread {s['chord_spread'] * 1e6:.0f}us | drift {s['drift'] * 1e6:+.0f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sheet compilation and playback dispatch.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000],
+                        help="note counts for the compile benchmark")
+    parser.add_argument("--dispatch-notes", type=int, default=100000)
+    parser.add_argument("--jitter-notes", type=int, default=300)
+    parser.add_argument("--delay", type=float, default=0.01, help="beat length for the jitter run (s)")
+    parser.add_argument("--wait", default="hybrid", help="wait strategy for the jitter run")
+    args = parser.parse_args()
+
+    player = PianoPlayer(verbosity="off", wait=args.wait, backend="null")
+    bench_compile(player, args.sizes)
+    bench_dispatch(player, args.dispatch_notes)
+    bench_jitter(player, args.jitter_notes, args.delay)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Output latency calibration: how long each backend takes to emit a frame.
+
+    python calibrate.py                      # the default backend
+    python calibrate.py --backend pynput --repeats 500
+
+Frames of the backend's probe key (F24 on evdev, a key no game binds) are
+sent with and without a shift change, and the cost is fitted as
+base + per_write * writes. The fit is saved per backend in
+~/.config/autoblox/calibration.json; PianoPlayer loads it and starts each
+frame that much early, so it lands on its beat and shifted notes no longer
+trail unshifted ones.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+from backends import BACKENDS, create_backend
+from library import write_atomic
+from timeline import PRESS, RELEASE
+from timing import SYSTEM_CLOCK
+
+CONFIG_DIR = os.path.join(os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config"), "autoblox")
+PROFILE_PATH = os.path.join(CONFIG_DIR, "calibration.json")
+
+# Largest chord measured, and how often each frame shape is sent
+MAX_NOTES = 4
+REPEATS = 200
+
+
+class OutputCost:
+    """Predicted time (seconds) a backend takes to send a frame: base + per_write * writes."""
+    __slots__ = ('base', 'per_write')
+
+    def __init__(self, base=0.0, per_write=0.0):
+        self.base = base
+        self.per_write = per_write
+
+    def lead(self, output, frame):
+        return self.base + self.per_write * output.writes(frame)
+
+    def __str__(self):
+        return f"{self.base * 1e6:.1f}us + {self.per_write * 1e6:.1f}us/write"
+
+
+def load_profile(path=PROFILE_PATH):
+    """The saved profile as {backend: entry}; empty if there is none."""
+    try:
+        with open(path) as f:
+            profile = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as err:
+        print(f"[ERR] Calibration profile unreadable ({err}); ignoring it.")
+        return {}
+    return profile if isinstance(profile, dict) else {}
+
+
+def output_cost(backend, path=PROFILE_PATH, profile=None):
+    """The saved OutputCost of a backend, or None if it was never calibrated.
+
+    `profile` is an already loaded profile to look it up in instead of the file.
+    """
+    entry = (load_profile(path) if profile is None else profile).get(backend)
+    if not entry:
+        return None
+    return OutputCost(entry.get("base", 0.0), entry.get("per_write", 0.0))
+
+
+def measure(output, repeats=REPEATS, clock=SYSTEM_CLOCK):
+    """Median send time in seconds, by number of key writes, for frames of the probe key."""
+    now = clock.now
+    probe = output.probe_code
+    if output.batched:
+        send = output.send_frame
+    else:
+        def send(frame):
+            for event in frame:
+                output.send_event(*event)
+
+    samples = {}
+    for _ in range(repeats):
+        for notes in range(1, MAX_NOTES + 1):
+            for shifted in (False, True):
+                for action in (PRESS, RELEASE):
+                    frame = [(probe, shifted, action)] * notes
+                    writes = output.writes(frame)
+                    start = now()
+                    send(frame)
+                    samples.setdefault(writes, []).append(now() - start)
+                output.release_modifiers()
+    return {writes: statistics.median(costs) for writes, costs in sorted(samples.items())}
+
+
+def fit(medians):
+    """Least-squares OutputCost through {writes: seconds}."""
+    points = list(medians.items())
+    mean_w = sum(w for w, _ in points) / len(points)
+    mean_c = sum(c for _, c in points) / len(points)
+    var = sum((w - mean_w) ** 2 for w, _ in points)
+    per_write = sum((w - mean_w) * (c - mean_c) for w, c in points) / var if var else 0.0
+    per_write = max(0.0, per_write)
+    return OutputCost(max(0.0, mean_c - per_write * mean_w), per_write)
+
+
+def save_cost(backend, cost, medians, path=PROFILE_PATH):
+    profile = load_profile(path)
+    profile[backend] = {"base": cost.base, "per_write": cost.per_write,
+                        "medians": {str(writes): c for writes, c in medians.items()},
+                        "measured": time.time()}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_atomic(path, json.dumps(profile, indent=1, sort_keys=True))
+
+
+def calibrate(backend=None, repeats=REPEATS, path=PROFILE_PATH):
+    """Measure a backend, save its OutputCost and return it."""
+    output = create_backend(backend)
+    try:
+        medians = measure(output, repeats)
+    finally:
+        output.close()
+    cost = fit(medians)
+    save_cost(output.name, cost, medians, path)
+    for writes, seconds in medians.items():
+        print(f"[LOG]   {writes} writes: {seconds * 1e6:.1f}us")
+    print(f"[LOG] {output.name}: {cost} (saved to {path})")
+    return cost
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure how long an output backend takes to send key events.")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), help="backend to measure (default: evdev, else pynput)")
+    parser.add_argument("--repeats", type=int, default=REPEATS, help="times each frame shape is sent")
+    parser.add_argument("--profile", default=PROFILE_PATH, help="profile file to update")
+    args = parser.parse_args(argv)
+    calibrate(args.backend, args.repeats, args.profile)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
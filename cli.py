@@ -0,0 +1,137 @@
+"""Headless command-line player.
+
+    python cli.py song.txt --bpm 120 --humanize
+    cat song.txt | python cli.py --loop --backend evdev
+    python cli.py song.txt --dry-run
+    python cli.py song.mid                # real note lengths and tempo changes
+
+Only the selected output backend is loaded, and nothing here imports Tk.
+"""
+import argparse
+import sys
+
+from auto import PianoPlayer
+from backends import BACKENDS
+from eventlog import VERBOSITY
+from humanize import Humanizer
+from timeline import PRESS
+from timing import WAIT_STRATEGIES
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Play a piano sheet by injecting key presses.")
+    parser.add_argument("sheet", nargs="?", default="-",
+                        help="sheet file, .mid file, or - for stdin (default)")
+    parser.add_argument("--bpm", type=float, help="tempo in beats per minute")
+    parser.add_argument("--hold", type=float, help="fraction of each beat a note is held (0.1-1.0)")
+    parser.add_argument("--humanize", action="store_true", help="randomize timing slightly")
+    parser.add_argument("--seed", type=int, help="seed for --humanize, for repeatable runs")
+    parser.add_argument("--jitter", type=float, default=0.005, help="humanize: press timing error in seconds")
+    parser.add_argument("--drift", type=float, default=0.01,
+                        help="humanize: tempo drift per beat, as a fraction of a beat (0 disables)")
+    parser.add_argument("--hold-variance", type=float, default=0.1,
+                        help="humanize: hold length variation, as a fraction of the hold")
+    parser.add_argument("--loop", action="store_true", help="repeat until interrupted (Ctrl+C)")
+    parser.add_argument("--stream", action="store_true", help="start playing while the sheet is still parsed")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), help="output backend (default: evdev, else pynput)")
+    parser.add_argument("--wait", choices=sorted(WAIT_STRATEGIES), default="hybrid", help="timing engine")
+    parser.add_argument("--log", choices=list(VERBOSITY), default="summary", help="log verbosity")
+    parser.add_argument("--realtime", type=int, default=0, metavar="PRIORITY",
+                        help="SCHED_FIFO priority for the dispatch thread (needs root)")
+    parser.add_argument("--cpus", type=int, nargs="+", help="pin the dispatch thread to these CPUs")
+    parser.add_argument("--no-lead", action="store_true",
+                        help="ignore the calibration profile and send each event exactly on its beat")
+    parser.add_argument("--timings", metavar="PATH", help="write per-event timings to a .csv or .json file")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="compile and report without opening an output device")
+    return parser
+
+
+def read_sheet(path):
+    if path == "-":
+        return sys.stdin.read()
+    with open(path) as f:
+        return f.read()
+
+
+def is_midi(path):
+    return path.lower().endswith((".mid", ".midi"))
+
+
+def dry_run(player, sheet, timeline=None):
+    """Compile the sheet and print what would be played."""
+    if timeline is None:
+        timeline = player.events(sheet, streaming=False)
+    notes = sum(1 for *_, action in timeline if action == PRESS)
+    print(f"[LOG] Dry run: {notes} notes, {len(timeline)} events | "
+          f"Estimated Duration: {timeline.duration(player.delay):.2f}s")
+    marks = timeline.tempo_marks()
+    if marks:
+        print(f"[LOG] Tempo marks: {' '.join(f'{60.0 / delay:.0f}' for _, delay in marks)} BPM")
+    if timeline.unknown:
+        print(f"[LOG] Unknown symbols skipped: {' '.join(timeline.unknown)}")
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    midi = is_midi(args.sheet)
+    if midi:
+        # Only MIDI input pays for the MIDI module (and its process pool imports)
+        from midi import midi_timeline, read_midi
+    try:
+        # A MIDI file is compiled below, once the backend is known
+        song = read_midi(args.sheet) if midi else None
+        sheet = "" if midi else read_sheet(args.sheet)
+    except FileNotFoundError:
+        print(f"[ERR] {args.sheet} not found.")
+        return 1
+    except ValueError as err:
+        print(f"[ERR] {err}")
+        return 1
+
+    settings = {}
+    if args.bpm:
+        settings['delay'] = 60.0 / args.bpm
+    if args.hold:
+        settings['hold_percent'] = args.hold
+    elif midi:
+        # Notes are held for exactly their written length
+        settings['hold_percent'] = 1.0
+
+    humanizer = Humanizer(seed=args.seed, jitter=args.jitter, drift=args.drift, hold_variance=args.hold_variance)
+    # Every backend resolves the same notes, so a dry run compiles against
+    # the null backend instead of opening a device
+    backend = 'null' if args.dry_run else args.backend
+    player = PianoPlayer(humanize=args.humanize, streaming=args.stream, verbosity=args.log, wait=args.wait,
+                         backend=backend, humanizer=humanizer, realtime=args.realtime, cpus=args.cpus,
+                         compensate=not args.no_lead, **settings)
+    timeline = None
+    if midi:
+        # --bpm sets the opening tempo; the file's tempo changes keep their proportions
+        timeline = midi_timeline(song, BACKENDS[player.backend].notes.get, args.bpm)
+        if args.humanize:
+            # Loop variants are re-rendered from sheet text, which a MIDI file does not have
+            print("[LOG] Humanize is not applied to MIDI files.")
+            player.humanize = False
+    if args.dry_run:
+        status = dry_run(player, sheet, timeline)
+        player.close()
+        return status
+
+    player.loop = args.loop
+    try:
+        player.play(sheet, timeline=timeline)
+    except KeyboardInterrupt:
+        print("[LOG] Interrupted.")
+        player.stop()
+    finally:
+        player.close()
+    if args.timings:
+        player.telemetry.export(args.timings)
+        print(f"[LOG] Timings written to {args.timings}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
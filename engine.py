@@ -0,0 +1,281 @@
+"""Out-of-process playback engine.
+
+The GUI process still compiles sheets, but the timed loop runs in a child
+process with its own interpreter, so Tk repaints and the hotkey listener
+never hold its GIL. Compiled timelines are handed over in shared memory;
+the stop flag and progress counters live in a small shared control block,
+and start/settings commands go over a pipe.
+"""
+import multiprocessing
+import threading
+from multiprocessing import shared_memory
+
+from auto import PianoPlayer
+from backends import BACKENDS
+from eventlog import LOG_EVENTS
+from timeline import Timeline, get_timeline
+
+# Control block slots (int64 each)
+STOP = 0      # set by the GUI, polled by the engine's waits
+PLAYING = 1   # 1 while the engine is performing
+SENT = 2      # events sent so far in the current pass
+PASS = 3      # current loop pass
+TRACK = 4     # queued songs started so far
+CONTROL_SLOTS = 5
+
+
+class SharedFlag:
+    """threading.Event look-alike backed by one control block slot.
+
+    Only the GUI side clears it (right before sending 'play'), so clear()
+    is a no-op here: a stop issued just after 'play' is never lost.
+    """
+
+    def __init__(self, control, index):
+        self.control = control
+        self.index = index
+
+    def is_set(self):
+        return self.control[self.index] != 0
+
+    def set(self):
+        self.control[self.index] = 1
+
+    def clear(self):
+        pass
+
+
+def _perform(player, conn, control, sheet_content, timeline):
+    try:
+        player.play(sheet_content, timeline=timeline)
+    finally:
+        control[PLAYING] = 0
+        # Queued songs may have changed the tempo and hold
+        conn.send(('done', player.delay, player.hold_percent))
+
+
+def engine_main(conn, control_name, options):
+    """Entry point of the engine process: run a PianoPlayer and obey commands.
+
+    Commands are tuples: ('play', segment, count, end_beat, unknown, sheet),
+    ('set', name, value), ('enqueue', sheet, delay, hold, title),
+    ('clear_queue',), or None to exit.
+    """
+    control_shm = shared_memory.SharedMemory(control_name)
+    control = control_shm.buf.cast('q')
+    try:
+        player = PianoPlayer(stop_event=SharedFlag(control, STOP), **options)
+    except Exception:
+        # Exiting closes the pipe, which tells the GUI the engine failed to start
+        control.release()
+        control_shm.close()
+        raise
+    player.progress = control[SENT:TRACK + 1]
+    conn.send(('ready', player.backend))
+
+    segment = None
+    worker = None
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        command, *args = message
+        if command == 'play':
+            name, count, end_beat, unknown, sheet_content = args
+            if worker is not None:
+                worker.join()
+            if segment is None or segment.name != name:
+                if segment is not None:
+                    segment.close()
+                segment = shared_memory.SharedMemory(name)
+            timeline = Timeline.from_buffer(segment.buf, count, end_beat, unknown)
+            worker = threading.Thread(target=_perform, args=(player, conn, control, sheet_content, timeline),
+                                      daemon=True)
+            worker.start()
+            del timeline
+        elif command in ('enqueue', 'clear_queue'):
+            # The engine compiles queued songs itself, in the background
+            getattr(player, command)(*args)
+        elif command == 'set':
+            name, value = args
+            # delay / wait_strategy / verbosity have setters; the rest are plain attributes
+            setter = getattr(player, 'set_' + name, None)
+            if setter is not None:
+                setter(value)
+            else:
+                setattr(player, name, value)
+        else:
+            print(f"[ERR] Engine: unknown command {command!r}")
+
+    player.stop()
+    if worker is not None:
+        worker.join()
+    player.close()
+    # Views into shared memory must go before the segments can be closed
+    player.progress.release()
+    control.release()
+    control_shm.close()
+    if segment is not None:
+        segment.close()
+
+
+def _remote(name):
+    """Setting mirrored locally and forwarded to the engine process when set."""
+    attr = '_' + name
+
+    def get(self):
+        return getattr(self, attr)
+
+    def set(self, value):
+        setattr(self, attr, value)
+        self._send('set', name, value)
+
+    return property(get, set)
+
+
+class EngineProcess:
+    """Drop-in for PianoPlayer that performs in a separate process.
+
+    play() compiles in this process, copies the timeline into a shared
+    memory segment (reused while the same timeline is replayed) and blocks
+    until the engine reports it is done. stop() is a single store into the
+    shared control block. Streaming mode is not available here.
+    """
+    delay = _remote('delay')
+    hold_percent = _remote('hold_percent')
+    humanize = _remote('humanize')
+    loop = _remote('loop')
+    gap = _remote('gap')
+
+    def __init__(self, delay=0.095, hold_percent=0.8, humanize=False, verbosity=LOG_EVENTS, wait='hybrid',
+                 backend=None, realtime=0, cpus=None, lock_memory=False):
+        self._delay = delay
+        self._hold_percent = hold_percent
+        self._humanize = humanize
+        self._loop = False
+        self._gap = 0.0
+        self._send_lock = threading.Lock()
+        self._segment = None
+        self._shared = None
+
+        self._control_shm = shared_memory.SharedMemory(create=True, size=8 * CONTROL_SLOTS)
+        self.control = self._control_shm.buf.cast('q')
+        # Same shape as PianoPlayer.progress: [events sent this pass, pass number, queued songs started]
+        self.progress = self.control[SENT:TRACK + 1]
+
+        # spawn, not fork: the child must not inherit Tk or listener threads
+        context = multiprocessing.get_context('spawn')
+        self._conn, child_conn = context.Pipe()
+        options = dict(delay=delay, hold_percent=hold_percent, humanize=humanize, verbosity=verbosity,
+                       wait=wait, backend=backend, realtime=realtime, cpus=cpus, lock_memory=lock_memory)
+        self.process = context.Process(target=engine_main, args=(child_conn, self._control_shm.name, options),
+                                       name="autoblox-engine", daemon=True)
+        self.process.start()
+        child_conn.close()
+
+        try:
+            _, self.backend = self._conn.recv()
+        except EOFError:
+            # The engine died before it was up (e.g. no output device could be opened)
+            self.process.join(timeout=2)
+            self.process = None
+            self.progress.release()
+            self.control.release()
+            self._control_shm.close()
+            self._control_shm.unlink()
+            raise RuntimeError("engine process exited during startup")
+        self._notes = BACKENDS[self.backend].notes
+        print(f"[LOG] Engine process started (pid {self.process.pid}, backend: {self.backend})")
+
+    def _send(self, *message):
+        with self._send_lock:
+            self._conn.send(message)
+
+    def set_delay(self, delay):
+        self.delay = delay
+
+    def set_wait_strategy(self, wait):
+        self._send('set', 'wait_strategy', wait)
+
+    def set_verbosity(self, verbosity):
+        self._send('set', 'verbosity', verbosity)
+
+    def enqueue(self, sheet_content, delay=None, hold_percent=None, title=None):
+        self._send('enqueue', sheet_content, delay, hold_percent, title)
+
+    def clear_queue(self):
+        self._send('clear_queue')
+
+    def compile(self, sheet_content):
+        return get_timeline(sheet_content, self._delay, self._hold_percent, self._humanize,
+                            self._notes.get, self.backend)
+
+    def _share(self, timeline):
+        """Put a timeline in shared memory and return the segment's name."""
+        if timeline is not self._shared:
+            size = max(1, timeline.nbytes())
+            if self._segment is None or self._segment.size < size:
+                self._release_segment()
+                self._segment = shared_memory.SharedMemory(create=True, size=size)
+            timeline.write_into(self._segment.buf)
+            self._shared = timeline
+        return self._segment.name
+
+    def _release_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._segment.unlink()
+            self._segment = None
+            self._shared = None
+
+    def play(self, sheet_content, timeline=None):
+        """Play a sheet in the engine process; returns when it finishes or is stopped."""
+        if timeline is None:
+            timeline = self.compile(sheet_content)
+        name = self._share(timeline)
+        control = self.control
+        control[STOP] = 0
+        control[SENT] = 0
+        control[PASS] = 0
+        control[TRACK] = 0
+        control[PLAYING] = 1
+        try:
+            self._send('play', name, len(timeline), timeline.end_beat, timeline.unknown, sheet_content)
+            # Only play() reads from the pipe once the engine is up
+            while True:
+                reply = self._conn.recv()
+                if reply[0] == 'done':
+                    _, self._delay, self._hold_percent = reply
+                    return
+        except (EOFError, OSError):
+            # The engine is gone; nothing is playing any more
+            control[PLAYING] = 0
+            print("[ERR] Engine process exited during playback.")
+
+    def stop(self):
+        self.control[STOP] = 1
+
+    @property
+    def playing(self):
+        return bool(self.control[PLAYING])
+
+    def close(self):
+        """Shut the engine down and free the shared memory."""
+        if self.process is None:
+            return
+        self.stop()
+        try:
+            with self._send_lock:
+                self._conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=2)
+        self.process = None
+        self._release_segment()
+        self.progress.release()
+        self.control.release()
+        self._control_shm.close()
+        self._control_shm.unlink()
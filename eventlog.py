@@ -0,0 +1,109 @@
+import array
+import threading
+
+from timeline import PRESS
+
+# Verbosity levels
+LOG_OFF = 0
+LOG_SUMMARY = 1
+LOG_EVENTS = 2
+
+VERBOSITY = {'off': LOG_OFF, 'summary': LOG_SUMMARY, 'events': LOG_EVENTS}
+
+# Record kinds (PRESS / RELEASE are shared with the timeline)
+PROGRESS = 2
+LOOP = 3
+TRACK = 4
+
+
+class EventLog:
+    """Ring buffer the dispatch loop writes raw numbers into.
+
+    There is exactly one producer (the dispatch thread, which only moves
+    `_head`) and one consumer (the drain thread, which only moves `_tail`),
+    so no lock is needed: a slot is filled before `_head` is published.
+    Formatting and printing happen on the drain thread. When the drain
+    falls behind, new records are counted as dropped rather than blocking.
+    """
+
+    def __init__(self, verbosity=LOG_EVENTS, size=4096, interval=0.05):
+        self.verbosity = VERBOSITY.get(verbosity, verbosity)
+        self.size = size
+        self.interval = interval
+        self._kinds = array.array('B', bytes(size))
+        self._a = array.array('q', bytes(8 * size))
+        self._b = array.array('q', bytes(8 * size))
+        self._t = array.array('d', bytes(8 * size))
+        self._head = 0
+        self._tail = 0
+        self.dropped = 0
+        self._reported_dropped = 0
+        self._drain_lock = threading.Lock()
+        self._thread = None
+
+    def set_verbosity(self, verbosity):
+        self.verbosity = VERBOSITY.get(verbosity, verbosity)
+
+    def record(self, kind, a, b, t):
+        """Store one record; called from the real-time thread."""
+        head = self._head
+        if head - self._tail >= self.size:
+            self.dropped += 1
+            return
+        i = head % self.size
+        self._kinds[i] = kind
+        self._a[i] = a
+        self._b[i] = b
+        self._t[i] = t
+        self._head = head + 1
+
+    def info(self, text):
+        """Print a pre-formatted line from outside the timed loop."""
+        if self.verbosity >= LOG_SUMMARY:
+            self.flush()
+            print(text)
+
+    def start(self):
+        """Start the background drain thread (once)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._drain_loop, daemon=True)
+            self._thread.start()
+
+    def flush(self):
+        """Drain everything recorded so far on the calling thread."""
+        with self._drain_lock:
+            self._drain()
+
+    def _drain_loop(self):
+        wait = threading.Event().wait
+        while True:
+            wait(self.interval)
+            self.flush()
+
+    def _drain(self):
+        head = self._head
+        tail = self._tail
+        size = self.size
+        lines = []
+        while tail < head:
+            i = tail % size
+            kind = self._kinds[i]
+            if kind == TRACK:
+                lines.append(f"[LOG] Playlist: next song at {self._t[i]:.2f}s ({self._b[i]} more queued)")
+            elif kind == LOOP:
+                lines.append(f"[LOG] Loop enabled. Restarting playback... (pass {self._a[i] + 1} at {self._t[i]:.2f}s)")
+            elif kind == PROGRESS:
+                total = self._b[i]
+                lines.append(f"[LOG] Playing event {self._a[i]}/{total if total >= 0 else '?'} "
+                             f"(Time: {self._t[i]:.2f}s)")
+            else:
+                action = "PRESS" if kind == PRESS else "RELEASE"
+                lines.append(f"[VERBOSE] {action}: {self._a[i]}{' +SHIFT' if self._b[i] else ''}")
+            tail += 1
+        self._tail = tail
+
+        if self.dropped != self._reported_dropped:
+            lines.append(f"[LOG] Event log overflow: {self.dropped - self._reported_dropped} records dropped")
+            self._reported_dropped = self.dropped
+        if lines:
+            print("\n".join(lines))
@@ -1,50 +1,28 @@
 import customtkinter as ctk
 import os
+import queue
 import threading
 import time
-import selectors
 from auto import PianoPlayer
+from backends import BACKENDS
+from engine import EngineProcess
+from hotkeys import EVDEV_AVAILABLE, HotkeyListener, key_code, key_name
+from library import Library
+from realtime import RT_PRIORITY
+from recorder import Recorder, events_to_sheet
+from timeline import IncrementalCompiler
 from tkinter import filedialog
+import tkinter as tk
 
-# evdev for global hotkey on Wayland
-try:
-    import evdev
-    from evdev import ecodes as e
-    EVDEV_AVAILABLE = True
-except ImportError:
-    EVDEV_AVAILABLE = False
-
-def find_keyboard_devices():
-    """Find all real physical keyboard devices via evdev."""
-    if not EVDEV_AVAILABLE:
-        return []
-    kbd_list = []
-    try:
-        devices = [evdev.InputDevice(path) for path in evdev.list_devices()]
-        print(f"[LOG] Scanning {len(devices)} devices for physical keyboards...")
-        for dev in devices:
-            # EXCLUDE virtual devices
-            name_lower = dev.name.lower()
-            if "uinput" in name_lower or "virtual" in name_lower:
-                continue
-                
-            caps = dev.capabilities()
-            # A physical keyboard must have EV_KEY and common keys
-            if e.EV_KEY in caps:
-                key_caps = caps[e.EV_KEY]
-                if e.KEY_A in key_caps and e.KEY_Z in key_caps:
-                    print(f"[LOG] OK: Found physical keyboard: {dev.name} ({dev.path})")
-                    kbd_list.append(dev)
-    except Exception as ex:
-        print(f"[ERR] Error listing devices: {ex}")
-    return kbd_list
+# Editor contents are recompiled once typing pauses for this long
+COMPILE_DEBOUNCE_MS = 300
 
 class PianoApp(ctk.CTk):
     def __init__(self):
         super().__init__()
 
         self.title("Roblox Piano Auto Player")
-        self.geometry("600x720")
+        self.geometry("600x860")
         
         # Appearance
         ctk.set_appearance_mode("dark")
@@ -59,13 +37,26 @@ class PianoApp(ctk.CTk):
         self.configure(fg_color=COLOR_GRAPHITE)
 
         print("[LOG] Initializing PianoPlayer...")
-        self.player = PianoPlayer(delay=60.0/67.0, hold_percent=0.67, humanize=False)
+        self.engine = "thread"
+        self.player = self._create_player(self.engine, delay=60.0/67.0, hold_percent=0.67, humanize=False,
+                                          verbosity="summary", wait="hybrid")
         self.playing = False
         self.loop_mode = False
         self.sheet_content = ""
         self.hotkey_key = "F5"
         self.recording_hotkey = False
-        self._stop_listener = threading.Event()
+        self.hotkey_listener = None
+        self.recorder = None  # needs the evdev listener
+        self.library = Library()
+        self.library_titles = []
+        # Songs queued after the current one as enqueue() arguments, for
+        # display and to hand over to a new engine
+        self.queue_items = []
+        # Background compile of the editor: latest text wins, lines are re-parsed only when changed
+        self.compiler = None
+        self._compile_job = None
+        self._compile_requests = queue.Queue()
+        threading.Thread(target=self._compile_loop, name="autoblox-compile", daemon=True).start()
 
         # Backend status for Wayland
         self.backend_msg = f"Backend: {self.player.backend}"
@@ -86,6 +77,19 @@ class PianoApp(ctk.CTk):
                                       font=ctk.CTkFont(size=14, weight="bold"), text_color=COLOR_ALABASTER)
         self.label_box.pack(side="left")
 
+        self.entry_title = ctk.CTkEntry(self.frame_sheet_header, placeholder_text="Title",
+                                        width=160, height=24, fg_color=COLOR_CHARCOAL,
+                                        text_color=COLOR_WHITE, border_color=COLOR_CHARCOAL)
+        self.entry_title.pack(side="left", padx=(10, 0))
+
+        self.btn_save = ctk.CTkButton(self.frame_sheet_header, text="Save",
+                                       width=60, height=24,
+                                       fg_color=COLOR_CHARCOAL,
+                                       hover_color=COLOR_GRAPHITE,
+                                       text_color=COLOR_ALABASTER,
+                                       command=self.save_to_library)
+        self.btn_save.pack(side="right", padx=(5, 0))
+
         self.btn_clear = ctk.CTkButton(self.frame_sheet_header, text="Clear", 
                                         width=60, height=24,
                                         fg_color=COLOR_CHARCOAL,
@@ -93,10 +97,64 @@ class PianoApp(ctk.CTk):
                                         text_color=COLOR_ALABASTER,
                                         command=self.clear_sheet)
         self.btn_clear.pack(side="right")
+
+        self.btn_record = ctk.CTkButton(self.frame_sheet_header, text="Record",
+                                        width=60, height=24,
+                                        fg_color=COLOR_CHARCOAL,
+                                        hover_color=COLOR_GRAPHITE,
+                                        text_color=COLOR_ALABASTER,
+                                        command=self.toggle_recording)
+        self.btn_record.pack(side="right", padx=(0, 5))
         
+        # Library: search box and list of saved sheets
+        self.frame_library = ctk.CTkFrame(self, fg_color="transparent",
+                                          border_width=2, border_color=COLOR_CHARCOAL)
+        self.frame_library.pack(pady=(5, 0), padx=20, fill="x")
+
+        self.entry_search = ctk.CTkEntry(self.frame_library, placeholder_text="Search library...",
+                                         fg_color=COLOR_CHARCOAL, text_color=COLOR_WHITE,
+                                         border_color=COLOR_CHARCOAL)
+        self.entry_search.pack(pady=(8, 4), padx=10, fill="x")
+        self.entry_search.bind("<KeyRelease>", lambda event: self.refresh_library())
+
+        self.list_library = tk.Listbox(self.frame_library, height=5, bg=COLOR_CHARCOAL, fg=COLOR_WHITE,
+                                       selectbackground=COLOR_SILVER, selectforeground=COLOR_GRAPHITE,
+                                       highlightthickness=0, borderwidth=0, activestyle="none")
+        self.list_library.pack(pady=(0, 4), padx=10, fill="x")
+        self.list_library.bind("<<ListboxSelect>>", self.select_from_library)
+
+        # Playlist: queued songs follow the current one without stopping
+        self.frame_queue = ctk.CTkFrame(self.frame_library, fg_color="transparent")
+        self.frame_queue.pack(pady=(0, 8), padx=10, fill="x")
+
+        self.btn_enqueue = ctk.CTkButton(self.frame_queue, text="Add to Queue", width=110, height=24,
+                                         fg_color=COLOR_SILVER, text_color=COLOR_GRAPHITE,
+                                         hover_color=COLOR_ALABASTER, command=self.add_to_queue)
+        self.btn_enqueue.pack(side="left")
+
+        self.btn_clear_queue = ctk.CTkButton(self.frame_queue, text="Clear Queue", width=90, height=24,
+                                             fg_color=COLOR_CHARCOAL, text_color=COLOR_ALABASTER,
+                                             hover_color=COLOR_GRAPHITE, command=self.clear_queue)
+        self.btn_clear_queue.pack(side="left", padx=(5, 0))
+
+        self.menu_gap = ctk.CTkOptionMenu(self.frame_queue, values=["gap 0s", "gap 1s", "gap 2s", "gap 3s", "gap 5s"],
+                                          command=self.update_gap, width=90, height=24,
+                                          fg_color=COLOR_CHARCOAL, button_color=COLOR_CHARCOAL,
+                                          button_hover_color=COLOR_SILVER)
+        self.menu_gap.set("gap 0s")
+        self.menu_gap.pack(side="left", padx=(5, 0))
+
+        self.label_queue = ctk.CTkLabel(self.frame_queue, text="Queue empty", text_color=COLOR_ALABASTER)
+        self.label_queue.pack(side="left", padx=(10, 0))
+
         self.textbox = ctk.CTkTextbox(self, height=220, fg_color=COLOR_CHARCOAL, 
                                       text_color=COLOR_WHITE, font=("Courier", 12))
-        self.textbox.pack(pady=(5, 10), padx=20, fill="both", expand=True)
+        self.textbox.pack(pady=(5, 0), padx=20, fill="both", expand=True)
+        self.textbox.bind("<<Modified>>", self._on_edit)
+
+        # Live stats of the editor contents, from the background compile
+        self.label_stats = ctk.CTkLabel(self, text="", font=ctk.CTkFont(size=11), text_color=COLOR_SILVER)
+        self.label_stats.pack(pady=(0, 5), padx=20, anchor="w")
 
 
         self.frame_combined = ctk.CTkFrame(self, fg_color="transparent")
@@ -168,6 +226,48 @@ class PianoApp(ctk.CTk):
                                          button_hover_color=COLOR_ALABASTER)
         self.switch_loop.pack(pady=10, padx=10)
 
+        # Engine Settings (Logging & Timing)
+        self.frame_engine = ctk.CTkFrame(self, fg_color="transparent", 
+                                         border_width=2, border_color=COLOR_CHARCOAL)
+        self.frame_engine.pack(pady=5, padx=20, fill="x")
+
+        self.label_log = ctk.CTkLabel(self.frame_engine, text="Log:", text_color=COLOR_ALABASTER)
+        self.label_log.grid(row=0, column=0, padx=(10, 5), pady=10)
+
+        self.menu_log = ctk.CTkOptionMenu(self.frame_engine, values=["off", "summary", "events"],
+                                          command=self.update_verbosity,
+                                          fg_color=COLOR_CHARCOAL,
+                                          button_color=COLOR_CHARCOAL,
+                                          button_hover_color=COLOR_SILVER,
+                                          width=110)
+        self.menu_log.set("summary")
+        self.menu_log.grid(row=0, column=1, padx=(0, 10), pady=10)
+
+        self.label_timing = ctk.CTkLabel(self.frame_engine, text="Timing:", text_color=COLOR_ALABASTER)
+        self.label_timing.grid(row=0, column=2, padx=(10, 5), pady=10)
+
+        self.menu_timing = ctk.CTkOptionMenu(self.frame_engine, values=["hybrid", "deadline", "sleep"],
+                                             command=self.update_timing,
+                                             fg_color=COLOR_CHARCOAL,
+                                             button_color=COLOR_CHARCOAL,
+                                             button_hover_color=COLOR_SILVER,
+                                             width=110)
+        self.menu_timing.set("hybrid")
+        self.menu_timing.grid(row=0, column=3, padx=(0, 10), pady=10)
+
+        self.label_engine = ctk.CTkLabel(self.frame_engine, text="Engine:", text_color=COLOR_ALABASTER)
+        self.label_engine.grid(row=0, column=4, padx=(10, 5), pady=10)
+
+        # thread: dispatch thread in this process; process: separate engine process
+        self.menu_engine = ctk.CTkOptionMenu(self.frame_engine, values=["thread", "process"],
+                                             command=self.update_engine,
+                                             fg_color=COLOR_CHARCOAL,
+                                             button_color=COLOR_CHARCOAL,
+                                             button_hover_color=COLOR_SILVER,
+                                             width=110)
+        self.menu_engine.set(self.engine)
+        self.menu_engine.grid(row=0, column=5, padx=(0, 10), pady=10)
+
         # Hotkey Setting
         self.frame_hotkey = ctk.CTkFrame(self, fg_color="transparent", 
                                          border_width=2, border_color=COLOR_CHARCOAL)
@@ -213,10 +313,26 @@ class PianoApp(ctk.CTk):
 
         # Load initial sheet
         self.load_initial_sheet("sheet.txt")
+        self.refresh_library()
 
         # Start global hotkey listener
         self._start_global_hotkey_listener()
 
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def _create_player(self, engine, **settings):
+        # Only the dispatch thread (or engine process) goes real-time; the UI stays at normal priority
+        cls = EngineProcess if engine == "process" else PianoPlayer
+        return cls(realtime=RT_PRIORITY, lock_memory=True, **settings)
+
+    def on_close(self):
+        if self.hotkey_listener is not None:
+            self.hotkey_listener.stop()
+        self.player.stop()
+        self.player.close()
+        self.library.flush()
+        self.destroy()
+
     def load_initial_sheet(self, path):
         if os.path.exists(path):
             print(f"[LOG] Loading initial sheet: {path}")
@@ -226,26 +342,204 @@ class PianoApp(ctk.CTk):
             except:
                 pass
 
+    # ---- Library ----
+    def refresh_library(self):
+        """Refill the list from the in-memory index (no disk access)."""
+        entries = self.library.search(self.entry_search.get())
+        self.library_titles = [entry["title"] for entry in entries]
+        self.list_library.delete(0, "end")
+        for entry in entries:
+            line = f"{entry['title']}  ({entry['notes']} notes"
+            if "duration" in entry:
+                minutes, seconds = divmod(int(entry["duration"]), 60)
+                line += f", {minutes}:{seconds:02d} @ {entry['bpm']} BPM"
+            self.list_library.insert("end", line + ")")
+
+    def select_from_library(self, event=None):
+        selection = self.list_library.curselection()
+        if not selection or self.playing:
+            return
+        title = self.library_titles[selection[0]]
+        entry = self.library.entries[title]
+        try:
+            content = self.library.read(title)
+        except OSError as ex:
+            print(f"[ERR] Could not read {title}: {ex}")
+            return
+        self.textbox.delete("1.0", "end")
+        self.textbox.insert("1.0", content)
+        self.entry_title.delete(0, "end")
+        self.entry_title.insert(0, title)
+        # Restore the tempo and hold the song was last played with
+        if "bpm" in entry:
+            self.slider_tempo.set(entry["bpm"])
+            self.update_tempo(entry["bpm"])
+        if "hold" in entry:
+            self.slider_hold.set(entry["hold"])
+            self.update_hold_percent(entry["hold"])
+        print(f"[LOG] Loaded from library: {title}")
+
+    def save_to_library(self):
+        title = self.entry_title.get().strip()
+        content = self.textbox.get("1.0", "end-1c")
+        if not title or not content.strip():
+            print("[LOG] Enter a title and a sheet to save.")
+            return
+        # Index updates at once; the files are written on the library's thread
+        self.library.save_async(title, content, int(self.slider_tempo.get()), round(self.slider_hold.get(), 2))
+        self.refresh_library()
+        print(f"[LOG] Saved to library: {title}")
+
+    # ---- Playlist ----
+    def add_to_queue(self):
+        """Queue the selected library sheet, or else the editor contents."""
+        selection = self.list_library.curselection()
+        if selection:
+            title = self.library_titles[selection[0]]
+            entry = self.library.entries[title]
+            content = self.library.read(title)
+            bpm, hold = entry.get("bpm"), entry.get("hold")
+        else:
+            content = self.textbox.get("1.0", "end-1c")
+            title = self.entry_title.get().strip() or "Untitled"
+            bpm, hold = int(self.slider_tempo.get()), round(self.slider_hold.get(), 2)
+        if not content.strip():
+            print("[LOG] Nothing to queue.")
+            return
+        # Compiled in the background while the song before it plays
+        item = (content, 60.0 / bpm if bpm else None, hold, title)
+        self.player.enqueue(*item)
+        self.queue_items.append(item)
+        self._update_queue_label()
+        print(f"[LOG] Queued: {title}")
+
+    def clear_queue(self):
+        self.player.clear_queue()
+        self.queue_items.clear()
+        self._update_queue_label()
+
+    def update_gap(self, value):
+        self.player.gap = float(value.split()[1].rstrip("s"))
+        print(f"[LOG] Gap between songs: {self.player.gap:.0f}s")
+
+    def _update_queue_label(self, started=0):
+        upcoming = [title for *_, title in self.queue_items[started:]]
+        if not upcoming:
+            text = "Queue empty"
+        else:
+            text = "Up next: " + ", ".join(upcoming[:2])
+            if len(upcoming) > 2:
+                text += f" (+{len(upcoming) - 2})"
+        self.label_queue.configure(text=text)
+
+    # ---- Background Compile ----
+    def _on_edit(self, event=None):
+        # <<Modified>> only fires again once the flag is reset
+        self.textbox.edit_modified(False)
+        self._schedule_compile()
+
+    def _schedule_compile(self):
+        """Compile the editor contents once edits (or slider moves) pause."""
+        if self._compile_job is not None:
+            self.after_cancel(self._compile_job)
+        self._compile_job = self.after(COMPILE_DEBOUNCE_MS, self._request_compile)
+
+    def _request_compile(self):
+        self._compile_job = None
+        self._compile_requests.put(self.textbox.get("1.0", "end-1c"))
+
+    def _compile_loop(self):
+        while True:
+            content = self._compile_requests.get()
+            # Only the newest text matters
+            while not self._compile_requests.empty():
+                content = self._compile_requests.get_nowait()
+            player = self.player
+            try:
+                if self.compiler is None or self.compiler.backend != player.backend:
+                    self.compiler = IncrementalCompiler(BACKENDS[player.backend].notes.get, player.backend)
+                score = self.compiler.update(content)
+                # Render for the current settings as well, so Start finds the timeline cached.
+                # Not during playback, where it would compete with the dispatch thread for
+                # the GIL, nor when humanized, since those renders are never cached
+                if content.strip() and not self.playing and not player.humanize:
+                    player.compile(content)
+            except Exception as ex:
+                # e.g. the player was closed by an engine switch; the next edit compiles again
+                print(f"[ERR] Background compile failed: {ex}")
+                continue
+            self.after(0, self._show_stats, score, player.delay)
+
+    def _show_stats(self, score, delay):
+        if not len(score) and not score.unknown:
+            self.label_stats.configure(text="")
+            return
+        minutes, seconds = divmod(int(score.duration(delay)), 60)
+        text = f"{len(score)} notes | {minutes}:{seconds:02d}"
+        if score.unknown:
+            text += f" | Unknown symbols: {' '.join(score.unknown)}"
+        self.label_stats.configure(text=text, text_color="#FF5555" if score.unknown else "#B5B5B5")
+
     # ---- Tempo ----
     def update_tempo(self, value):
         bpm = int(value)
         # Convert BPM to Delay (Seconds): delay = 60 / BPM
         delay = 60.0 / bpm
-        self.player.delay = delay
+        # Applies immediately, even mid-song
+        self.player.set_delay(delay)
         self.label_tempo.configure(text=f"Tempo (BPM: {bpm})")
+        self._schedule_compile()
         # print(f"[LOG] Tempo changed: {bpm} BPM (Delay: {delay:.4f}s)")
 
     def update_hold_percent(self, value):
         self.player.hold_percent = float(value)
         self.label_hold.configure(text=f"Hold Percentage: {int(float(value)*100)}%")
+        self._schedule_compile()
 
     def update_humanize(self):
         self.player.humanize = self.switch_human.get()
         state = "ON" if self.player.humanize else "OFF"
         print(f"[LOG] Humanize Mode: {state}")
+        self._schedule_compile()
+
+    def update_verbosity(self, value):
+        self.player.set_verbosity(value)
+        print(f"[LOG] Log verbosity: {value}")
+
+    def update_timing(self, value):
+        self.player.set_wait_strategy(value)
+        print(f"[LOG] Timing engine: {value}")
+
+    def update_engine(self, value):
+        if self.playing:
+            print("[LOG] Stop playback before switching engines.")
+            self.menu_engine.set(self.engine)
+            return
+        old = self.player
+        settings = dict(delay=old.delay, hold_percent=old.hold_percent, humanize=old.humanize,
+                        verbosity=self.menu_log.get(), wait=self.menu_timing.get())
+        # The old player stays until the new one is up, so a failed switch changes nothing
+        try:
+            player = self._create_player(value, **settings)
+        except Exception as ex:
+            print(f"[ERR] Could not start the {value} engine ({ex}); keeping the {self.engine} engine.")
+            self.menu_engine.set(self.engine)
+            return
+        old.close()
+        self.player = player
+        self.player.loop = self.loop_mode
+        # The playlist and its gap move over to the new player
+        self.player.gap = old.gap
+        for item in self.queue_items:
+            self.player.enqueue(*item)
+        self.engine = value
+        self._schedule_compile()
+        print(f"[LOG] Playback engine: {value}")
 
     def update_loop(self):
         self.loop_mode = bool(self.switch_loop.get())
+        # The player checks this at the end of each pass
+        self.player.loop = self.loop_mode
         state = "ON" if self.loop_mode else "OFF"
         print(f"[LOG] Loop Mode: {state}")
 
@@ -255,92 +549,68 @@ class PianoApp(ctk.CTk):
 
     # ---- Global Hotkey via evdev (Multi-Device) ----
     def _start_global_hotkey_listener(self):
-        """Start a background thread that reads keyboard events from ALL found keyboards."""
+        """Start the long-lived listener that watches every physical keyboard."""
         if not EVDEV_AVAILABLE:
             print("[ERR] evdev not available for global hotkey listener.")
             return
-        
-        self._stop_listener.clear()
-        threading.Thread(target=self._evdev_listener_loop, daemon=True).start()
-        print("[LOG] Global hotkey listener (Multi-Device) started.")
-
-    def _evdev_listener_loop(self):
-        """Monitor multiple keyboard devices simultaneously using selectors."""
-        kbds = find_keyboard_devices()
-        if not kbds:
-            print("[ERR] No physical keyboards found for global listener.")
-            return
 
-        selector = selectors.DefaultSelector()
-        for k in kbds:
-            selector.register(k, selectors.EVENT_READ)
-            print(f"[LOG] Monitoring: {k.name}")
+        self.hotkey_listener = HotkeyListener(key_code(self.hotkey_key), self._on_hotkey)
+        self.recorder = Recorder(self.hotkey_listener)
+        self.hotkey_listener.start()
+
+    def _on_hotkey(self):
+        # Runs on the listener thread; hand over to the Tk thread
+        print(f"[LOG] Hotkey {self.hotkey_key} triggered!")
+        # While recording, the hotkey ends the take instead of starting playback
+        self.after(0, self.toggle_recording if self.recorder.recording else self.toggle_playing)
+
+    # ---- Recording ----
+    def toggle_recording(self):
+        """Record playing on the physical keyboard into the editor, quantized to the tempo slider."""
+        if self.recorder is None:
+            print("[ERR] Recording needs evdev access to the keyboards.")
+            return
+        if not self.recorder.recording:
+            if self.playing:
+                print("[LOG] Stop playback before recording.")
+                return
+            self.recorder.start()
+            self.btn_record.configure(text="Stop", fg_color="#FF5555", text_color="white")
+            print(f"[LOG] Recording at {int(self.slider_tempo.get())} BPM... (press {self.hotkey_key} to stop)")
+            return
 
-        try:
-            while not self._stop_listener.is_set():
-                for key, mask in selector.select(timeout=0.5):
-                    device = key.fileobj
-                    for event in device.read():
-                        if self.recording_hotkey: continue
-                        if event.type == e.EV_KEY and event.value == 1:
-                            key_name = evdev.ecodes.KEY[event.code].replace("KEY_", "")
-                            if key_name.upper() == self.hotkey_key.upper():
-                                print(f"[LOG] Hotkey {self.hotkey_key} triggered on {device.name}!")
-                                self.after(0, self.toggle_playing)
-        except Exception as ex:
-            print(f"[ERR] Multi-listener error: {ex}")
-        finally:
-            selector.close()
+        events = self.recorder.stop()
+        self.btn_record.configure(text="Record", fg_color="#595959", text_color="#E0E0E0")
+        sheet, hold = events_to_sheet(events, int(self.slider_tempo.get()))
+        if not sheet:
+            print("[LOG] Nothing recorded.")
+            return
+        self.textbox.delete("1.0", "end")
+        self.textbox.insert("1.0", sheet)
+        if hold is not None:
+            self.slider_hold.set(hold)
+            self.update_hold_percent(hold)
+        print(f"[LOG] Recorded {len(events)} key events.")
 
     # ---- Hotkey Recording ----
     def start_hotkey_recording(self):
-        if self.recording_hotkey: return
-        
+        if self.recording_hotkey or self.hotkey_listener is None: return
+
         print("[LOG] Entering hotkey recording mode (All Keyboards)...")
         self.recording_hotkey = True
-        self._stop_listener.set()
-        
+
         self.btn_set_hotkey.configure(text="Press any key...", fg_color="#595959")
         self.label_hotkey_display.configure(text="[ ? ]")
-        
-        threading.Thread(target=self._record_hotkey_evdev, daemon=True).start()
-
-    def _record_hotkey_evdev(self):
-        """Record from any physical keyboard."""
-        kbds = find_keyboard_devices()
-        if not kbds:
-            self.after(0, lambda: self.btn_set_hotkey.configure(text="Change Hotkey", fg_color="#B5B5B5"))
-            self.recording_hotkey = False
-            self._start_global_hotkey_listener()
-            return
-
-        selector = selectors.DefaultSelector()
-        for k in kbds:
-            selector.register(k, selectors.EVENT_READ)
-
-        captured_key = None
-        try:
-            finished = False
-            while not finished:
-                for key, mask in selector.select():
-                    device = key.fileobj
-                    for event in device.read():
-                        if event.type == e.EV_KEY and event.value == 1:
-                            captured_key = evdev.ecodes.KEY[event.code].replace("KEY_", "")
-                            print(f"[LOG] Captured {captured_key} from {device.name}")
-                            finished = True
-                            break
-                    if finished: break
-        except Exception as ex:
-            print(f"[ERR] Recording error: {ex}")
 
-        if captured_key:
-            self.hotkey_key = captured_key.upper()
-            self.after(0, self._update_hotkey_ui)
+        # The next key press on any keyboard becomes the hotkey
+        self.hotkey_listener.capture_next(self._on_hotkey_captured)
 
-        selector.close()
+    def _on_hotkey_captured(self, code):
+        self.hotkey_key = key_name(code)
+        print(f"[LOG] Captured {self.hotkey_key}")
+        self.hotkey_listener.set_hotkey(code)
         self.recording_hotkey = False
-        self._start_global_hotkey_listener()
+        self.after(0, self._update_hotkey_ui)
 
     def _update_hotkey_ui(self):
         self.label_hotkey_display.configure(text=f"[ {self.hotkey_key} ]")
@@ -353,14 +623,12 @@ class PianoApp(ctk.CTk):
             if not self.sheet_content.strip():
                 print("[LOG] Play attempt with empty input box.")
                 self.label_box.configure(text_color="red", text="INPUT BOX IS EMPTY!")
-                self.after(2000, lambda: self.label_box.configure(text_color="#E0E0E0", text="Paste or Edit Music Sheet Below:"))
+                self.after(2000, lambda: self.label_box.configure(text_color="#E0E0E0",
+                                                                  text="Paste or Edit Music Sheet Below:"))
                 return
             
-            try:
-                with open("sheet.txt", "w") as f:
-                    f.write(self.sheet_content)
-            except:
-                pass
+            # Written in the background so the Tk thread never waits on disk
+            self.library.write_file_async("sheet.txt", self.sheet_content)
 
             print("[LOG] Starting playback process...")
             self.playing = True
@@ -371,7 +639,8 @@ class PianoApp(ctk.CTk):
             self.playing = False
             self.player.stop()
             self.label_countdown.configure(text="")
-            self.btn_toggle.configure(text="START AUTO", fg_color="#E0E0E0", text_color="#303030", hover_color="#FFFFFF")
+            self.btn_toggle.configure(text="START AUTO", fg_color="#E0E0E0", text_color="#303030",
+                                      hover_color="#FFFFFF")
 
     def play_music(self):
         # Countdown only once
@@ -380,19 +649,41 @@ class PianoApp(ctk.CTk):
             self.after(0, lambda n=i: self.label_countdown.configure(text=f"Starting in {n}..."))
             time.sleep(1)
         
-        while self.playing:
-            self.after(0, lambda: self.label_countdown.configure(text="Playing..."))
-            self.player.play(self.sheet_content)
-            
-            # If loop is off or we stopped manually, break the cycle
-            if not self.loop_mode or not self.playing:
-                break
-            
-            print("[LOG] Loop enabled. Restarting playback...")
+        self.after(0, lambda: self.label_countdown.configure(text="Playing..."))
+        self.after(250, self._show_progress)
+        # Stored timelines are memory-mapped instead of compiled
+        timeline = self.library.compiled(self.sheet_content, self.player)
+        # Loop Mode repeats inside the player on one continuous timeline
+        self.player.play(self.sheet_content, timeline=timeline)
+        self.after(0, self._playback_finished)
         
         self.playing = False
         self.after(0, lambda: self.label_countdown.configure(text=""))
-        self.after(0, lambda: self.btn_toggle.configure(text="START AUTO", fg_color="#E0E0E0", text_color="#303030", hover_color="#FFFFFF"))
+        self.after(0, lambda: self.btn_toggle.configure(text="START AUTO", fg_color="#E0E0E0", text_color="#303030",
+                                                        hover_color="#FFFFFF"))
+
+    def _playback_finished(self):
+        # Queued songs that were played have left the player's queue, and
+        # the last one may have changed the tempo and hold
+        del self.queue_items[:self.player.progress[2]]
+        self._update_queue_label()
+        bpm = round(60.0 / self.player.delay)
+        self.slider_tempo.set(bpm)
+        self.label_tempo.configure(text=f"Tempo (BPM: {bpm})")
+        self.slider_hold.set(self.player.hold_percent)
+        self.label_hold.configure(text=f"Hold Percentage: {int(self.player.hold_percent * 100)}%")
+
+    def _show_progress(self):
+        # Reads the player's live counters; in process mode they are in shared memory
+        if not self.playing:
+            return
+        sent, passes, tracks = self.player.progress
+        text = f"Playing... {sent} events"
+        if passes:
+            text += f" (pass {passes + 1})"
+        self.label_countdown.configure(text=text)
+        self._update_queue_label(tracks)
+        self.after(250, self._show_progress)
 
 if __name__ == "__main__":
     app = PianoApp()
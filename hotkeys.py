@@ -0,0 +1,259 @@
+"""Global hotkeys read straight from physical keyboards (works under Wayland).
+
+One HotkeyListener thread lives for the whole session. It blocks in a
+single select() over every keyboard, an inotify watch on /dev/input and a
+self-pipe, so it wakes only for key events, device hotplug or shutdown.
+"""
+import ctypes
+import ctypes.util
+import os
+import selectors
+import struct
+import threading
+
+try:
+    import evdev
+    from evdev import ecodes as e
+    EVDEV_AVAILABLE = True
+except ImportError:
+    EVDEV_AVAILABLE = False
+
+INPUT_DIR = "/dev/input"
+
+# inotify flags (linux/inotify.h)
+IN_ATTRIB = 0x00000004
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# struct inotify_event: wd, mask, cookie, len, then `len` bytes of name
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    _inotify_init1 = _libc.inotify_init1
+    _inotify_add_watch = _libc.inotify_add_watch
+    _inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+except (OSError, AttributeError, TypeError):
+    _inotify_init1 = None
+
+# Selector keys for the non-device file descriptors
+_WAKE = "wake"
+_HOTPLUG = "hotplug"
+
+
+def key_code(name):
+    """Keycode for a key name such as 'F5' (or 'KEY_F5'); None if unknown."""
+    if not EVDEV_AVAILABLE:
+        return None
+    name = name.upper()
+    if not name.startswith("KEY_"):
+        name = "KEY_" + name
+    return e.ecodes.get(name)
+
+
+def key_name(code):
+    """Display name for a keycode: 'F5' for KEY_F5."""
+    name = e.KEY.get(code, str(code)) if EVDEV_AVAILABLE else str(code)
+    if isinstance(name, list):
+        name = name[0]
+    return name.replace("KEY_", "")
+
+
+def is_physical_keyboard(dev):
+    """True for real keyboards; skips our own uinput device and other virtual ones."""
+    name_lower = dev.name.lower()
+    if "uinput" in name_lower or "virtual" in name_lower:
+        return False
+    # A physical keyboard must have EV_KEY and common keys
+    key_caps = dev.capabilities().get(e.EV_KEY, ())
+    return e.KEY_A in key_caps and e.KEY_Z in key_caps
+
+
+def _watch_input_dir():
+    """Non-blocking inotify fd watching INPUT_DIR for device nodes; None if unavailable."""
+    if _inotify_init1 is None:
+        return None
+    fd = _inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if fd < 0:
+        return None
+    # IN_ATTRIB: udev often fixes a new node's permissions just after creating it
+    if _inotify_add_watch(fd, INPUT_DIR.encode(), IN_CREATE | IN_DELETE | IN_ATTRIB) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+class HotkeyListener:
+    """Calls `callback()` whenever the key with evdev code `code` goes down.
+
+    The device set is scanned once and then kept current by hotplug
+    events, so nothing is re-opened while the app runs. capture_next()
+    hands the next key press to a one-shot callback instead, for
+    rebinding without tearing the listener down. Sinks added with
+    add_sink() see every key press and release, with its kernel timestamp.
+    Callbacks and sinks run on the listener thread.
+    """
+
+    def __init__(self, code, callback):
+        self.code = code
+        self.callback = callback
+        self.devices = {}  # path -> open InputDevice
+        self._capture = None
+        self._sinks = ()
+        self._running = False
+        self._thread = None
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, _WAKE)
+        self._inotify = _watch_input_dir()
+        if self._inotify is not None:
+            self._selector.register(self._inotify, selectors.EVENT_READ, _HOTPLUG)
+        else:
+            print("[LOG] inotify unavailable: keyboards plugged in later will not be seen.")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        for path in evdev.list_devices():
+            self._add(path)
+        if not self.devices:
+            print("[ERR] No physical keyboards found for global listener (waiting for hotplug).")
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="autoblox-hotkeys", daemon=True)
+        self._thread.start()
+        print(f"[LOG] Global hotkey listener started ({len(self.devices)} keyboards).")
+
+    def stop(self):
+        """Stop the thread and close every device."""
+        self._running = False
+        self._wake()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for path in list(self.devices):
+            self._remove(path)
+        self._selector.close()
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+        if self._inotify is not None:
+            os.close(self._inotify)
+
+    def set_hotkey(self, code):
+        self.code = code
+
+    def capture_next(self, callback):
+        """Send the next key press to `callback(code)` instead of matching the hotkey."""
+        self._capture = callback
+
+    def cancel_capture(self):
+        self._capture = None
+
+    def add_sink(self, sink):
+        """Call `sink(code, value, sec, usec)` for every key press (1) and release (0).
+
+        sec/usec is the time the kernel stamped on the event, so queueing
+        and scheduling delays before the read do not show up in it. Sinks
+        must return quickly: the listener reads the next batch only after.
+        """
+        # Swapped as a whole, so the listener thread never sees a half-updated tuple
+        self._sinks = self._sinks + (sink,)
+
+    def remove_sink(self, sink):
+        self._sinks = tuple(s for s in self._sinks if s is not sink)
+
+    def _wake(self):
+        try:
+            os.write(self._wake_w, b"\0")
+        except OSError:
+            pass
+
+    def _add(self, path):
+        if path in self.devices or not os.path.basename(path).startswith("event"):
+            return
+        try:
+            dev = evdev.InputDevice(path)
+        except OSError:
+            # Not readable (yet); an IN_ATTRIB event retries once udev sets permissions
+            return
+        try:
+            keyboard = is_physical_keyboard(dev)
+        except OSError:
+            keyboard = False
+        if not keyboard:
+            dev.close()
+            return
+        self.devices[path] = dev
+        self._selector.register(dev, selectors.EVENT_READ, path)
+        print(f"[LOG] Monitoring: {dev.name} ({path})")
+
+    def _remove(self, path):
+        dev = self.devices.pop(path, None)
+        if dev is None:
+            return
+        try:
+            self._selector.unregister(dev)
+        except (KeyError, ValueError):
+            pass
+        try:
+            dev.close()
+        except OSError:
+            pass
+        print(f"[LOG] Keyboard removed: {path}")
+
+    def _hotplug(self):
+        try:
+            data = os.read(self._inotify, 4096)
+        except BlockingIOError:
+            return
+        pos = 0
+        while pos < len(data):
+            _, mask, _, length = _INOTIFY_EVENT.unpack_from(data, pos)
+            pos += _INOTIFY_EVENT.size
+            name = data[pos:pos + length].rstrip(b"\0").decode()
+            pos += length
+            path = os.path.join(INPUT_DIR, name)
+            if mask & IN_DELETE:
+                self._remove(path)
+            else:
+                self._add(path)
+
+    def _run(self):
+        EV_KEY = e.EV_KEY
+        select = self._selector.select
+        while self._running:
+            for key, _ in select():
+                source = key.data
+                if source == _WAKE:
+                    try:
+                        os.read(self._wake_r, 512)
+                    except BlockingIOError:
+                        pass
+                    continue
+                if source == _HOTPLUG:
+                    self._hotplug()
+                    continue
+                try:
+                    events = key.fileobj.read()
+                    for event in events:
+                        if event.type != EV_KEY:
+                            continue
+                        # Autorepeat (value 2) is not a key transition
+                        if event.value != 2:
+                            for sink in self._sinks:
+                                sink(event.code, event.value, event.sec, event.usec)
+                        if event.value != 1:
+                            continue
+                        capture = self._capture
+                        if capture is not None:
+                            self._capture = None
+                            capture(event.code)
+                        elif event.code == self.code:
+                            self.callback()
+                except BlockingIOError:
+                    pass
+                except OSError:
+                    # Unplugged between the select and the read
+                    self._remove(source)
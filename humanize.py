@@ -0,0 +1,115 @@
+"""Humanization: timing and duration randomness for compiled sheets.
+
+A Humanizer owns its own seeded random.Random, so a given seed reproduces
+a performance exactly, on any machine. Compiled timelines draw all of a
+sheet's randomness in one batch(); streaming playback draws per note.
+"""
+import array
+import math
+import random
+
+# Drift is clipped at this many standard deviations, which bounds how early
+# a humanized note can land (the streaming parser's look-ahead relies on it)
+DRIFT_LIMIT = 4.0
+
+
+class Humanizer:
+    """Distributions for humanized playback, all in seconds unless noted.
+
+    jitter          press timing error, uniform in +/- jitter
+    roll            (min, max) delay between consecutive notes of a chord
+    hold_variance   hold length factor, uniform in 1 +/- hold_variance
+                    (like key velocity: some notes ring longer than others)
+    release_jitter  extra release delay, uniform in 0..release_jitter
+    drift           tempo drift: per-beat step of a mean-reverting
+                    push/pull, as a fraction of a beat (0 disables it)
+    drift_memory    how much of the previous beat's drift carries over (0..1)
+    """
+
+    def __init__(self, seed=None, jitter=0.005, roll=(0.005, 0.012), hold_variance=0.1, release_jitter=0.01,
+                 drift=0.01, drift_memory=0.9, rng=None):
+        self.rng = rng or random.Random(seed)
+        self.jitter = jitter
+        self.roll = roll
+        self.hold_variance = hold_variance
+        self.release_jitter = release_jitter
+        self.drift = drift
+        self.drift_memory = drift_memory
+
+    def seed(self, seed):
+        self.rng.seed(seed)
+
+    def note(self, slot):
+        """Offsets for one note: (press offset in seconds, hold factor, release jitter in seconds).
+
+        `slot` is the note's position in its chord (0 for single notes).
+        """
+        uniform = self.rng.uniform
+        press = uniform(-self.jitter, self.jitter)
+        if slot:
+            press += slot * uniform(*self.roll)
+        factor = uniform(1.0 - self.hold_variance, 1.0 + self.hold_variance)
+        return press, factor, uniform(0.0, self.release_jitter)
+
+    def drift_bound(self):
+        """Largest drift (in beats) step_drift() can produce."""
+        if not self.drift:
+            return 0.0
+        return DRIFT_LIMIT * self.drift / math.sqrt(1.0 - min(self.drift_memory, 0.99) ** 2)
+
+    def max_early(self, delay):
+        """How far (seconds) before its beat a press can land, at `delay` seconds per beat."""
+        return self.jitter + self.drift_bound() * delay
+
+    def step_drift(self, value):
+        """The next beat's drift (in beats) after `value`: a bounded, mean-reverting walk."""
+        if not self.drift:
+            return 0.0
+        bound = self.drift_bound()
+        value = self.drift_memory * value + self.rng.gauss(0.0, self.drift)
+        return max(-bound, min(bound, value))
+
+    def beat_drift(self, beats):
+        """Drift of beats 0..beats-1, in beats."""
+        drift = array.array('d', bytes(8 * beats))
+        if self.drift:
+            value = 0.0
+            for i in range(beats):
+                value = self.step_drift(value)
+                drift[i] = value
+        return drift
+
+    def batch(self, slots, beats, end_beat, delay):
+        """Draw every note's offsets at once.
+
+        `slots` and `beats` are the notes' chord positions and (integer)
+        beats. Returns (press offsets, hold factors, release jitters) as
+        arrays, with the tempo drift of each note's beat (at `delay` seconds
+        per beat) folded into its press offset.
+        """
+        n = len(slots)
+        uniform = self.rng.uniform
+        jitter, hold_variance, release_jitter = self.jitter, self.hold_variance, self.release_jitter
+        roll_min, roll_max = self.roll
+
+        press = array.array('d', [uniform(-jitter, jitter) for _ in range(n)])
+        factors = array.array('d', [uniform(1.0 - hold_variance, 1.0 + hold_variance) for _ in range(n)])
+        releases = array.array('d', [uniform(0.0, release_jitter) for _ in range(n)])
+
+        drift = self.beat_drift(int(end_beat)) if self.drift else None
+        for i in range(n):
+            slot = slots[i]
+            if slot:
+                press[i] += slot * uniform(roll_min, roll_max)
+            if drift is not None:
+                press[i] += drift[int(beats[i])] * delay
+        return press, factors, releases
+
+
+def as_humanizer(humanize, rng=random):
+    """A Humanizer for a `humanize` setting: None when off, a default one for True."""
+    if not humanize:
+        return None
+    if isinstance(humanize, Humanizer):
+        return humanize
+    return Humanizer(rng=rng)
@@ -0,0 +1,264 @@
+"""Sheet library: a directory of sheets with an index and compiled timelines.
+
+    library/
+        index.json          title, file, hash, notes, beats, bpm, hold per sheet
+        sheets/<name>.txt   the sheets themselves
+        compiled/*.tl       binary timelines, memory-mapped on load
+
+All writes go through one background thread, so saving never blocks the
+caller (the Tk thread, in the GUI).
+"""
+import glob
+import json
+import mmap
+import os
+import queue
+import re
+import struct
+import threading
+import time
+
+from timeline import Timeline, TempoMap, scan_sheet, sheet_hash
+
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "library")
+
+# Compiled timeline file: header, the columns as laid out by
+# Timeline.write_into, then the skipped symbols as UTF-8
+TIMELINE_MAGIC = b"ABTL"
+TIMELINE_VERSION = 1
+# magic, version, event count, end beat, unknown length (32 bytes keeps every column aligned)
+TIMELINE_HEADER = struct.Struct("<4sIQdI4x")
+
+
+def write_atomic(path, data):
+    """Write bytes or text to `path` via a temporary file and rename."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb" if isinstance(data, bytes) else "w") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def save_timeline(path, timeline):
+    unknown = timeline.unknown.encode("utf-8")
+    size = timeline.nbytes()
+    buf = bytearray(TIMELINE_HEADER.size + size + len(unknown))
+    TIMELINE_HEADER.pack_into(buf, 0, TIMELINE_MAGIC, TIMELINE_VERSION, len(timeline), timeline.end_beat, len(unknown))
+    timeline.write_into(memoryview(buf)[TIMELINE_HEADER.size:])
+    buf[TIMELINE_HEADER.size + size:] = unknown
+    write_atomic(path, bytes(buf))
+
+
+def load_timeline(path):
+    """Memory-map a saved timeline; its columns are views into the file, nothing is parsed."""
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, count, end_beat, unknown_len = TIMELINE_HEADER.unpack_from(mapped, 0)
+    if magic != TIMELINE_MAGIC or version != TIMELINE_VERSION:
+        raise ValueError(f"{path}: not a compiled timeline")
+    unknown = mapped[len(mapped) - unknown_len:].decode("utf-8") if unknown_len else ""
+    return Timeline.from_buffer(memoryview(mapped)[TIMELINE_HEADER.size:], count, end_beat, unknown)
+
+
+def sheet_stats(sheet_content):
+    """(notes, beats, tempo marks as (beat, delay)) of a sheet, without compiling it."""
+    notes = 0
+    beats = 0
+    marks = []
+    for step in scan_sheet(sheet_content):
+        if isinstance(step, float):
+            marks.append((beats, 60.0 / step))
+            continue
+        notes += len(step)
+        beats += 1
+    return notes, beats, marks
+
+
+def _filename(title):
+    return re.sub(r"[^\w\- ]+", "_", title).strip() or "untitled"
+
+
+class Library:
+    """Sheets on disk plus an in-memory index for instant search."""
+
+    def __init__(self, path=DEFAULT_DIR):
+        self.path = path
+        self.sheets_dir = os.path.join(path, "sheets")
+        self.compiled_dir = os.path.join(path, "compiled")
+        self.index_path = os.path.join(path, "index.json")
+        os.makedirs(self.sheets_dir, exist_ok=True)
+        os.makedirs(self.compiled_dir, exist_ok=True)
+        self.entries = {}  # title -> index entry
+        self._lock = threading.Lock()
+        self._jobs = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="autoblox-library", daemon=True)
+        self._writer.start()
+        self._load_index()
+
+    # ---- Index ----
+    def _load_index(self):
+        try:
+            with open(self.index_path) as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+        except (OSError, ValueError) as err:
+            print(f"[ERR] Library index unreadable ({err}); rebuilding.")
+            self.entries = {}
+        # Sheets dropped into the directory by hand get indexed too
+        known = {entry["file"] for entry in self.entries.values()}
+        added = False
+        for path in sorted(glob.glob(os.path.join(self.sheets_dir, "*.txt"))):
+            name = os.path.basename(path)
+            if name not in known:
+                with open(path) as f:
+                    content = f.read()
+                title = name[:-4]
+                self.entries[title] = self._entry(title, name, content)
+                added = True
+        if added:
+            self._submit(self._write_index)
+        self._submit(self._prune_compiled, self._hashes())
+        print(f"[LOG] Library: {len(self.entries)} sheets in {self.path}")
+
+    def _entry(self, title, filename, content, bpm=None, hold=None):
+        notes, beats, marks = sheet_stats(content)
+        entry = {"title": title, "file": filename, "hash": sheet_hash(content),
+                 "notes": notes, "beats": beats, "updated": time.time()}
+        if bpm is not None:
+            entry["bpm"] = bpm
+            tempo = TempoMap(60.0 / bpm)
+            for beat, delay in marks:
+                tempo.set_delay(delay, beat)
+            entry["duration"] = tempo.seconds(beats)
+        if hold is not None:
+            entry["hold"] = hold
+        return entry
+
+    def _write_index(self):
+        with self._lock:
+            data = json.dumps(self.entries, indent=1, sort_keys=True)
+        write_atomic(self.index_path, data)
+
+    def _hashes(self):
+        with self._lock:
+            return {entry["hash"] for entry in self.entries.values()}
+
+    def search(self, text=""):
+        """Entries whose title contains `text` (case-insensitive), by title."""
+        text = text.lower()
+        with self._lock:
+            found = [entry for title, entry in self.entries.items() if text in title.lower()]
+        return sorted(found, key=lambda entry: entry["title"].lower())
+
+    def read(self, title):
+        with open(os.path.join(self.sheets_dir, self.entries[title]["file"])) as f:
+            return f.read()
+
+    # ---- Saving (background) ----
+    def save_async(self, title, content, bpm=None, hold=None):
+        """Add or update a sheet; the index entry is visible at once, files follow."""
+        with self._lock:
+            old = self.entries.get(title)
+            filename = old["file"] if old else self._unused_filename(title)
+            entry = self._entry(title, filename, content, bpm, hold)
+            self.entries[title] = entry
+        self._submit(write_atomic, os.path.join(self.sheets_dir, filename), content)
+        self._submit(self._write_index)
+        if old is not None and old["hash"] != entry["hash"]:
+            self._forget_compiled(old["hash"])
+        return entry
+
+    def _unused_filename(self, title):
+        """File name for a new title; titles that sanitize alike ("Song?", "Song!") get a numbered suffix."""
+        base = _filename(title)
+        taken = {entry["file"] for entry in self.entries.values()}
+        filename = base + ".txt"
+        n = 2
+        while filename in taken or os.path.exists(os.path.join(self.sheets_dir, filename)):
+            filename = f"{base}_{n}.txt"
+            n += 1
+        return filename
+
+    def delete_async(self, title):
+        with self._lock:
+            entry = self.entries.pop(title, None)
+            # Indexes written before file names were made unique may share a file
+            shared = entry is not None and any(other["file"] == entry["file"] for other in self.entries.values())
+        if entry is not None:
+            if not shared:
+                self._submit(os.remove, os.path.join(self.sheets_dir, entry["file"]))
+            self._submit(self._write_index)
+            self._forget_compiled(entry["hash"])
+
+    def write_file_async(self, path, content):
+        """Write any file on the library's writer thread."""
+        self._submit(write_atomic, path, content)
+
+    def _submit(self, func, *args):
+        self._jobs.put((func, args))
+
+    def flush(self):
+        """Block until every queued write has finished."""
+        self._jobs.join()
+
+    def _write_loop(self):
+        while True:
+            func, args = self._jobs.get()
+            try:
+                func(*args)
+            except OSError as err:
+                print(f"[ERR] Library write failed: {err}")
+            finally:
+                self._jobs.task_done()
+
+    # ---- Compiled timelines ----
+    def _timeline_path(self, content_hash, backend, delay, hold_percent):
+        return os.path.join(self.compiled_dir,
+                            f"{content_hash}.{backend}.{round(delay * 1e6)}.{round(hold_percent * 1e4)}.tl")
+
+    def compiled(self, sheet_content, player):
+        """The player's (non-humanized) timeline for a sheet, from disk when stored.
+
+        A stored timeline is memory-mapped, so loading costs the same for any
+        length of song. Otherwise the player compiles it and, if the sheet is
+        saved in the library, the result is stored in the background,
+        replacing older tempos of the same sheet. Sheets that are not saved
+        are never stored, so the directory only grows with the library.
+        """
+        if player.humanize:
+            return player.compile(sheet_content)
+        content_hash = sheet_hash(sheet_content)
+        if content_hash not in self._hashes():
+            return player.compile(sheet_content)
+        path = self._timeline_path(content_hash, player.backend, player.delay, player.hold_percent)
+        try:
+            return load_timeline(path)
+        except (OSError, ValueError):
+            pass
+        timeline = player.compile(sheet_content)
+        self._submit(self._store_timeline, path, content_hash, player.backend, timeline)
+        return timeline
+
+    def _store_timeline(self, path, content_hash, backend, timeline):
+        if content_hash not in self._hashes():
+            # Changed or removed since it was compiled
+            return
+        for old in glob.glob(os.path.join(self.compiled_dir, f"{content_hash}.{backend}.*.tl")):
+            if old != path:
+                os.remove(old)
+        save_timeline(path, timeline)
+
+    def _forget_compiled(self, content_hash):
+        """Drop the stored timelines of a sheet no entry holds any more."""
+        if content_hash not in self._hashes():
+            self._submit(self._remove_compiled, content_hash)
+
+    def _remove_compiled(self, content_hash):
+        for path in glob.glob(os.path.join(self.compiled_dir, f"{content_hash}.*.tl")):
+            os.remove(path)
+
+    def _prune_compiled(self, hashes):
+        """Remove stored timelines of sheets that are not in the library."""
+        for path in glob.glob(os.path.join(self.compiled_dir, "*.tl")):
+            if os.path.basename(path).split(".", 1)[0] not in hashes:
+                os.remove(path)
@@ -0,0 +1,325 @@
+"""MIDI import: Standard MIDI Files to timelines or sheets.
+
+    python midi.py song.mid                      # print the sheet
+    python midi.py midi/ sheets/                 # convert a whole directory
+    python midi.py midi/ compiled/ --format tl   # binary timelines instead
+
+Tracks are decoded lazily from a memory-mapped file and merged in time
+order, so no list of raw MIDI events is ever built. Notes are mapped onto
+the 61-key Roblox piano (C2 to C7, shifted keys for the black notes);
+notes outside it are moved by whole octaves until they fit.
+"""
+import argparse
+import glob
+import heapq
+import mmap
+import os
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from backends import BACKENDS, LINUX_EVDEV
+from library import save_timeline, write_atomic
+from timeline import REST, TEMPO_MARK, format_sheet, timeline_from_notes
+
+# The piano's keys from C2 (MIDI note 36) up, one character per semitone
+PIANO_KEYS = "1!2@34$5%6^78*9(0qQwWeErtTyYuiIoOpPasSdDfgGhHjJklLzZxcCvVbBnm"
+LOWEST_NOTE = 36
+HIGHEST_NOTE = LOWEST_NOTE + len(PIANO_KEYS) - 1
+
+# The General MIDI percussion channel (10, counted from 0)
+DRUM_CHANNEL = 9
+
+# Tempo until the file sets one: 120 BPM, in microseconds per quarter note
+DEFAULT_TEMPO = 500000
+
+# Keycodes written into compiled timelines unless a backend is chosen
+DEFAULT_BACKEND = 'evdev' if LINUX_EVDEV else 'pynput'
+
+# Sheet steps per quarter note when writing sheet text (4: sixteenth notes)
+DEFAULT_GRID = 4
+
+# Event kinds yielded by the track decoder
+NOTE_OFF = 0
+NOTE_ON = 1
+SET_TEMPO = 2
+
+_CHUNK = struct.Struct(">4sI")
+_HEADER = struct.Struct(">HHH")
+
+
+def note_char(note):
+    """Piano key character for a MIDI note number, moved into range by octaves."""
+    while note < LOWEST_NOTE:
+        note += 12
+    while note > HIGHEST_NOTE:
+        note -= 12
+    return PIANO_KEYS[note - LOWEST_NOTE]
+
+
+def _read_varlen(data, pos):
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, pos
+
+
+def _track_events(data, pos, end):
+    """Yield (tick, kind, key, value) for the notes and tempo changes of one track chunk.
+
+    Notes are keyed by channel * 128 + note number; `value` is the velocity
+    of a note, or microseconds per quarter note for a tempo change.
+    """
+    tick = 0
+    status = 0
+    while pos < end:
+        delta, pos = _read_varlen(data, pos)
+        tick += delta
+        byte = data[pos]
+        if byte & 0x80:
+            pos += 1
+            if byte < 0xF0:
+                status = byte  # running status only applies to channel messages
+        elif status == 0:
+            raise ValueError("data byte without a status")
+        else:
+            byte = status
+
+        if byte == 0xFF:
+            meta = data[pos]
+            length, pos = _read_varlen(data, pos + 1)
+            if meta == 0x51 and length == 3:
+                yield tick, SET_TEMPO, 0, int.from_bytes(data[pos:pos + 3], "big")
+            elif meta == 0x2F:
+                return
+            pos += length
+        elif byte in (0xF0, 0xF7):
+            length, pos = _read_varlen(data, pos)
+            pos += length
+        else:
+            kind = byte & 0xF0
+            channel = byte & 0x0F
+            if kind in (0xC0, 0xD0):
+                pos += 1
+                continue
+            key, velocity = data[pos], data[pos + 1]
+            pos += 2
+            if channel == DRUM_CHANNEL:
+                continue
+            if kind == 0x90 and velocity:
+                yield tick, NOTE_ON, channel * 128 + key, velocity
+            elif kind in (0x80, 0x90):
+                yield tick, NOTE_OFF, channel * 128 + key, velocity
+
+
+class MidiSong:
+    """The notes and tempo map of a MIDI file, in ticks.
+
+    notes   (start tick, end tick, MIDI note number), by start
+    tempos  (tick, microseconds per quarter note); always starts at tick 0
+    """
+
+    def __init__(self, ppq, notes, tempos, end_tick):
+        self.ppq = ppq
+        self.notes = notes
+        self.tempos = tempos
+        self.end_tick = end_tick
+
+    @property
+    def bpm(self):
+        """The song's opening tempo in quarter notes per minute."""
+        return 60e6 / self.tempos[0][1]
+
+    def tempo_marks(self, bpm=None):
+        """Tempo changes as (beat, seconds per beat), one beat per quarter note.
+
+        With `bpm`, every tempo is scaled so the song opens at `bpm`.
+        """
+        scale = self.bpm / bpm if bpm else 1.0
+        return [(tick / self.ppq, tempo / 1e6 * scale) for tick, tempo in self.tempos]
+
+
+def read_midi(path):
+    """Read a Standard MIDI File (format 0 or 1) into a MidiSong."""
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        magic, length = _CHUNK.unpack_from(data, 0)
+        if magic != b"MThd" or length < _HEADER.size:
+            raise ValueError(f"{path}: not a MIDI file")
+        _, track_count, division = _HEADER.unpack_from(data, _CHUNK.size)
+        if division & 0x8000:
+            raise ValueError(f"{path}: SMPTE time division is not supported")
+
+        tracks = []
+        pos = _CHUNK.size + length
+        while len(tracks) < track_count and pos + _CHUNK.size <= len(data):
+            magic, length = _CHUNK.unpack_from(data, pos)
+            pos += _CHUNK.size
+            if magic == b"MTrk":
+                tracks.append(_track_events(data, pos, min(pos + length, len(data))))
+            pos += length
+
+        notes = []
+        tempos = []
+        sounding = {}  # key -> start ticks of its notes still held
+        end_tick = 0
+        for tick, kind, key, value in heapq.merge(*tracks, key=lambda event: event[0]):
+            end_tick = tick
+            if kind == SET_TEMPO:
+                if tempos and tempos[-1][0] == tick:
+                    tempos[-1] = (tick, value)
+                else:
+                    tempos.append((tick, value))
+            elif kind == NOTE_ON:
+                sounding.setdefault(key, []).append(tick)
+            else:
+                starts = sounding.get(key)
+                if starts:
+                    notes.append((starts.pop(0), tick, key & 0x7F))
+        # Notes never released end with the song
+        for key, starts in sounding.items():
+            notes.extend((start, end_tick, key & 0x7F) for start in starts)
+    except (IndexError, struct.error):
+        raise ValueError(f"{path}: truncated MIDI file")
+    finally:
+        data.close()
+
+    notes.sort()
+    if not tempos or tempos[0][0] > 0:
+        tempos.insert(0, (0, DEFAULT_TEMPO))
+    return MidiSong(division, notes, tempos, end_tick)
+
+
+def midi_timeline(song, resolve, bpm=None):
+    """Compile a MidiSong straight into a Timeline, with its real note lengths and tempo changes.
+
+    One beat is one quarter note, and the tempo changes are tempo marks, so
+    the song plays at its own tempo (play it at 100% hold for the written
+    note lengths), or, with `bpm`, proportionally faster or slower so that
+    it opens at `bpm`. Notes are mapped to keys with note_char() and `resolve`.
+    """
+    ppq = song.ppq
+    unknown = set()
+
+    def notes():
+        for start, end, note in song.notes:
+            char = note_char(note)
+            resolved = resolve(char)
+            if resolved is None:
+                unknown.add(char)
+                continue
+            yield start / ppq, resolved[0], resolved[1], (end - start) / ppq
+
+    marks = song.tempo_marks(bpm)
+    end_beat = max(song.end_tick, song.notes[-1][1] if song.notes else 0) / ppq
+    timeline = timeline_from_notes(notes(), marks, end_beat, marks[0][1])
+    timeline.unknown = ''.join(sorted(unknown))
+    return timeline
+
+
+def midi_sheet(song, grid=DEFAULT_GRID):
+    """Write a MidiSong as sheet text, `grid` steps per quarter note.
+
+    Note starts are rounded to the grid; notes starting on the same step
+    form a chord and empty steps become rests. Tempo marks are scaled so
+    each step lasts its share of a quarter note. Note lengths are not part
+    of the sheet format; the Hold setting decides them.
+    """
+    step_ticks = song.ppq / grid
+    marks = {round(tick / step_ticks): 60e6 / tempo * grid for tick, tempo in song.tempos}
+    chords = {}
+    for start, _, note in song.notes:
+        chord = chords.setdefault(round(start / step_ticks), [])
+        char = note_char(note)
+        if char not in chord:
+            chord.append(char)
+
+    last_step = max(chords, default=-1)
+    steps = []
+    for step in range(last_step + 1):
+        if step in marks:
+            steps.append(f"{TEMPO_MARK}{round(marks[step], 2):g}{TEMPO_MARK}")
+        chord = chords.get(step)
+        if not chord:
+            steps.append(REST)
+        else:
+            steps.append(chord[0] if len(chord) == 1 else f"[{''.join(chord)}]")
+    return format_sheet(steps)
+
+
+def _convert(path, output_dir, fmt, backend, grid):
+    """Convert one file; returns (path, notes, error). Runs in a worker process."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    try:
+        song = read_midi(path)
+        if fmt == "tl":
+            timeline = midi_timeline(song, BACKENDS[backend].notes.get)
+            save_timeline(os.path.join(output_dir, f"{name}.{backend}.tl"), timeline)
+        else:
+            write_atomic(os.path.join(output_dir, f"{name}.txt"), midi_sheet(song, grid))
+    except (OSError, ValueError) as err:
+        return path, 0, str(err)
+    return path, len(song.notes), None
+
+
+def convert_directory(input_dir, output_dir, fmt="txt", backend=DEFAULT_BACKEND, grid=DEFAULT_GRID, jobs=None):
+    """Convert every .mid file in a directory, one file per worker process.
+
+    Writes <name>.txt sheets, or with fmt='tl' compiled <name>.<backend>.tl
+    timelines (see library.load_timeline). Returns the number converted.
+    """
+    paths = sorted(path for path in glob.glob(os.path.join(input_dir, "*"))
+                   if path.lower().endswith((".mid", ".midi")))
+    os.makedirs(output_dir, exist_ok=True)
+    converted = 0
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = pool.map(_convert, paths, [output_dir] * len(paths), [fmt] * len(paths),
+                           [backend] * len(paths), [grid] * len(paths))
+        for path, notes, error in results:
+            if error:
+                print(f"[ERR] {error}")
+            else:
+                converted += 1
+                print(f"[LOG] Converted {os.path.basename(path)} ({notes} notes)")
+    print(f"[LOG] {converted}/{len(paths)} MIDI files converted to {output_dir}")
+    return converted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert MIDI files to sheets or compiled timelines.")
+    parser.add_argument("input", help="a .mid file, or a directory of them")
+    parser.add_argument("output", nargs="?", help="output directory (default: print one file's sheet)")
+    parser.add_argument("--format", choices=("txt", "tl"), default="txt",
+                        help="sheet text, or compiled timelines with real note lengths")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=DEFAULT_BACKEND,
+                        help="keycodes for --format tl")
+    parser.add_argument("--grid", type=int, default=DEFAULT_GRID, help="sheet steps per quarter note")
+    parser.add_argument("--jobs", type=int, help="worker processes (default: one per CPU)")
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.input):
+        convert_directory(args.input, args.output or ".", args.format, args.backend, args.grid, args.jobs)
+        return 0
+    try:
+        song = read_midi(args.input)
+    except (OSError, ValueError) as err:
+        print(f"[ERR] {err}")
+        return 1
+    if args.output is None:
+        sys.stdout.write(midi_sheet(song, args.grid))
+        return 0
+    os.makedirs(args.output, exist_ok=True)
+    _, notes, error = _convert(args.input, args.output, args.format, args.backend, args.grid)
+    if error:
+        print(f"[ERR] {error}")
+        return 1
+    print(f"[LOG] Converted {args.input} ({notes} notes)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
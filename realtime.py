@@ -0,0 +1,105 @@
+import ctypes
+import ctypes.util
+import gc
+import os
+
+# Default SCHED_FIFO priority for the dispatch thread (what run.sh used to
+# give the whole process through chrt)
+RT_PRIORITY = 99
+
+# mlockall() flags
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    _mlockall = _libc.mlockall
+    _mlockall.argtypes = [ctypes.c_int]
+except (OSError, AttributeError, TypeError):
+    _mlockall = None
+
+# Affinity and scheduling calls with pid 0 act on the calling thread only
+HAS_SCHED = hasattr(os, 'sched_setscheduler')
+HAS_AFFINITY = hasattr(os, 'sched_setaffinity')
+
+# CPUs the process started with, restored on demoted helper threads
+PROCESS_CPUS = os.sched_getaffinity(0) if HAS_AFFINITY else None
+
+_memory_locked = False
+
+
+def set_realtime(priority=RT_PRIORITY):
+    """Move the calling thread to SCHED_FIFO at `priority`; False if not permitted."""
+    if not HAS_SCHED:
+        return False
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+        return True
+    except (OSError, ValueError) as err:
+        print(f"[LOG] Real-time priority unavailable ({err}); dispatch runs at normal priority.")
+        return False
+
+
+def pin_cpus(cpus):
+    """Restrict the calling thread to the given CPU numbers; False if not possible."""
+    if not HAS_AFFINITY:
+        return False
+    try:
+        os.sched_setaffinity(0, cpus)
+        return True
+    except (OSError, ValueError) as err:
+        print(f"[LOG] CPU affinity {sorted(cpus)} failed: {err}")
+        return False
+
+
+def normal_priority():
+    """Drop the calling thread back to SCHED_OTHER on every CPU.
+
+    Threads inherit their creator's policy and affinity, so helpers started
+    from the real-time thread call this first.
+    """
+    if HAS_SCHED:
+        try:
+            os.sched_setscheduler(0, os.SCHED_OTHER, os.sched_param(0))
+        except OSError:
+            pass
+    if HAS_AFFINITY:
+        try:
+            os.sched_setaffinity(0, PROCESS_CPUS)
+        except OSError:
+            pass
+
+
+def lock_memory():
+    """mlockall() the process so the hot path never takes a page fault (once)."""
+    global _memory_locked
+    if _memory_locked:
+        return True
+    if _mlockall is None:
+        return False
+    if _mlockall(MCL_CURRENT | MCL_FUTURE) != 0:
+        err = ctypes.get_errno()
+        print(f"[LOG] mlockall failed: {os.strerror(err)}")
+        return False
+    _memory_locked = True
+    return True
+
+
+class GCPaused:
+    """Context manager: collect once up front, then keep the cyclic GC off.
+
+    Reference counting still frees almost everything a performance
+    allocates; only cycle detection (the source of multi-millisecond
+    pauses) waits until playback ends.
+    """
+
+    def __enter__(self):
+        self.was_enabled = gc.isenabled()
+        gc.collect()
+        gc.disable()
+        return self
+
+    def __exit__(self, *exc):
+        if self.was_enabled:
+            gc.enable()
+        return False
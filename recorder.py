@@ -0,0 +1,168 @@
+"""Performance recorder: turns playing on a physical keyboard into a sheet.
+
+    python recorder.py song.txt --bpm 120
+
+Key events come from the hotkey listener with their kernel timestamps, so
+the recording is as exact as the input device, however busy this process
+is. Presses are grouped into chords, quantized to one beat per step at the
+chosen BPM, and written as a sheet PianoPlayer.play() replays directly.
+"""
+import argparse
+import statistics
+import sys
+import time
+
+from backends import LINUX_EVDEV
+from hotkeys import EVDEV_AVAILABLE, HotkeyListener
+from timeline import REST, SPECIAL_CHARACTERS, format_sheet, is_note
+
+if LINUX_EVDEV:
+    from evdev import ecodes as e
+    from backends import EVDEV_KEYS
+    KEY_CHARS = {code: char for char, code in EVDEV_KEYS.items()}
+    SHIFT_KEYS = {e.KEY_LEFTSHIFT, e.KEY_RIGHTSHIFT}
+else:
+    KEY_CHARS = {}
+    SHIFT_KEYS = set()
+
+# Presses closer together than this (seconds) are one chord
+CHORD_WINDOW = 0.03
+
+# Shifted symbol for each base key ('1' -> '!')
+SHIFTED = {base: shifted for shifted, base in SPECIAL_CHARACTERS.items()}
+
+
+class Recorder:
+    """Collects raw key events from a HotkeyListener while recording."""
+
+    def __init__(self, listener):
+        self.listener = listener
+        self.events = []  # (seconds, code, value)
+        self.recording = False
+
+    def start(self):
+        self.events = []
+        self.recording = True
+        self.listener.add_sink(self._record)
+
+    def stop(self):
+        """Stop recording and return the captured events."""
+        self.listener.remove_sink(self._record)
+        self.recording = False
+        return self.events
+
+    def _record(self, code, value, sec, usec):
+        # Runs on the listener thread: just keep the event
+        self.events.append((sec + usec * 1e-6, code, value))
+
+
+def key_note(code, shifted):
+    """Sheet character a key produces (with shift held or not); None if it is not a note."""
+    char = KEY_CHARS.get(code)
+    if char is None:
+        return None
+    if shifted:
+        char = char.upper() if char.isalpha() else SHIFTED.get(char)
+    return char if char is not None and is_note(char) else None
+
+
+def performed_notes(events):
+    """Turn raw key events into (press time, note, held seconds or None) in press order."""
+    notes = []
+    shift_down = set()
+    sounding = {}  # code -> index in notes
+    for seconds, code, value in sorted(events, key=lambda event: event[0]):
+        if code in SHIFT_KEYS:
+            if value:
+                shift_down.add(code)
+            else:
+                shift_down.discard(code)
+            continue
+        if value:
+            note = key_note(code, bool(shift_down))
+            if note is not None:
+                sounding[code] = len(notes)
+                notes.append([seconds, note, None])
+        elif code in sounding:
+            note = notes[sounding.pop(code)]
+            note[2] = seconds - note[0]
+    return [tuple(note) for note in notes]
+
+
+def quantize(notes, bpm, chord_window=CHORD_WINDOW):
+    """Write performed notes as a sheet at `bpm`, one beat per step.
+
+    Presses within `chord_window` of a chord's first note join the chord.
+    Each chord lands on the beat nearest its first press (never on the
+    beat of the chord before it), and skipped beats become rests.
+    Returns (sheet, hold), where hold is the typical held fraction of a
+    beat, for the Hold setting, or None if no key was released.
+    """
+    if not notes:
+        return "", None
+    delay = 60.0 / bpm
+    chords = []  # [onset, notes]
+    for seconds, note, _ in notes:
+        if chords and seconds - chords[-1][0] <= chord_window:
+            if note not in chords[-1][1]:
+                chords[-1][1].append(note)
+        else:
+            chords.append([seconds, [note]])
+
+    start = chords[0][0]
+    steps = []
+    last = -1
+    for onset, chord in chords:
+        beat = max(round((onset - start) / delay), last + 1)
+        steps.extend([REST] * (beat - last - 1))
+        steps.append(chord[0] if len(chord) == 1 else f"[{''.join(chord)}]")
+        last = beat
+
+    sheet = format_sheet(steps, bpm)
+    held = [duration / delay for _, _, duration in notes if duration is not None]
+    hold = round(min(1.0, max(0.1, statistics.median(held))), 2) if held else None
+    return sheet, hold
+
+
+def events_to_sheet(events, bpm, chord_window=CHORD_WINDOW):
+    """Raw recorded key events to (sheet, hold); see quantize()."""
+    return quantize(performed_notes(events), bpm, chord_window)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record playing on a physical keyboard into a sheet.")
+    parser.add_argument("output", help="sheet file to write")
+    parser.add_argument("--bpm", type=float, default=120.0, help="tempo to quantize to (one note per beat)")
+    parser.add_argument("--chord-window", type=float, default=CHORD_WINDOW,
+                        help="presses closer than this many seconds form a chord")
+    args = parser.parse_args(argv)
+
+    if not EVDEV_AVAILABLE:
+        print("[ERR] evdev not available: recording needs access to /dev/input.")
+        return 1
+    # Only raw events are wanted; no hotkey is bound
+    listener = HotkeyListener(None, lambda: None)
+    recorder = Recorder(listener)
+    listener.start()
+    recorder.start()
+    print("[LOG] Recording... press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    events = recorder.stop()
+    listener.stop()
+
+    sheet, hold = events_to_sheet(events, args.bpm, args.chord_window)
+    with open(args.output, "w") as f:
+        f.write(sheet)
+    summary = f"[LOG] Recorded {len(events)} key events to {args.output}"
+    if hold is not None:
+        summary += f" | suggested hold {hold:.0%}"
+    print(summary)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,9 +10,9 @@ if [ ! -f "$PYTHON_BIN" ]; then
     exit 1
 fi
 
-echo "[*] Launching with Real-Time Priority (chrt -f 99)..."
+echo "[*] Launching with a Real-Time dispatch thread..."
 echo "[*] Password may be required for sudo access to hardware input devices."
 
-# Launching with FIFO scheduler at max priority (99)
-# This ensures the kernel prioritizes our timing loop above all else.
-sudo chrt -f 99 "$PYTHON_BIN" "$DIR/gui.py"
+# Root lets the player raise its own dispatch thread to SCHED_FIFO 99 and
+# lock memory; the rest of the app stays at normal priority.
+sudo "$PYTHON_BIN" "$DIR/gui.py"
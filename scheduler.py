@@ -0,0 +1,364 @@
+"""Multi-part playback: several sheets (duets, split hands) on one clock.
+
+    python scheduler.py left.txt right.txt:bpm=90:hold=0.5
+    python scheduler.py melody.txt bass.txt:backend=pynput --bpm 120 --humanize
+
+Each part keeps its own tempo, hold, humanization and, optionally, its own
+output device. Their frames are merged through a heap and sent from the
+single dispatch thread against one start time, so the parts cannot drift
+apart however long they play.
+"""
+import argparse
+import heapq
+import sys
+import threading
+
+from auto import PianoPlayer
+from backends import BACKENDS, create_backend
+from calibrate import load_profile, output_cost
+from eventlog import LOG_EVENTS, LOG_SUMMARY, LOOP, PROGRESS, VERBOSITY
+from humanize import Humanizer
+from realtime import GCPaused, normal_priority
+from telemetry import Telemetry
+from timeline import FRAME_EPSILON, PRESS, RELEASE, TempoMap, get_timeline, iter_frames
+
+
+class Part:
+    """One voice of an Ensemble: a sheet with its own settings.
+
+    `output` is a backend name or Backend for a dedicated device, or None
+    to share the ensemble's. A precompiled `timeline` (for example from a
+    MIDI file) is played instead of compiling `sheet_content`; otherwise a
+    humanized part gets a fresh rendering for every play and loop pass.
+    """
+
+    def __init__(self, sheet_content='', delay=0.095, hold_percent=0.8, humanize=False, humanizer=None,
+                 output=None, timeline=None, name=None):
+        self.sheet_content = sheet_content
+        self.delay = delay
+        self.hold_percent = hold_percent
+        self.humanize = humanize
+        self.humanizer = humanizer or Humanizer()
+        self._owns_output = isinstance(output, str)
+        self.output = create_backend(output) if self._owns_output else output
+        self.timeline = timeline
+        self._given = timeline is not None
+        self.name = name
+        # Beats -> seconds for this part while it plays
+        self.tempo = TempoMap(delay)
+
+    def compile(self, default_output):
+        """Compile the part's timeline for its output, unless it was given one."""
+        if not self._given:
+            self.timeline = self.render(default_output)
+        return self.timeline
+
+    @property
+    def varies(self):
+        """True if every pass should play a new humanized rendering."""
+        return self.humanize and not self._given
+
+    def render(self, default_output):
+        """A timeline of the part at its current settings; humanized ones are never cached."""
+        output = self.output or default_output
+        return get_timeline(self.sheet_content, self.delay, self.hold_percent,
+                            self.humanizer if self.humanize else None, output.notes.get, output.name)
+
+    def _hold(self):
+        return self.hold_percent
+
+    def close(self):
+        """Close the part's own output device, if it opened one."""
+        if self._owns_output and self.output is not None:
+            self.output.close()
+            self.output = None
+
+
+class Ensemble(PianoPlayer):
+    """PianoPlayer that performs several Parts at once.
+
+    play_parts() runs on the player's dispatch thread (real-time if
+    configured). Each part's frames are timed by its own TempoMap from one
+    shared start time; frames of different parts that land on the same
+    instant and device are sent as one frame. A key two parts hold at once
+    is only released when the last of them lets go, and a part pressing a
+    key another part holds strikes it again.
+    """
+
+    def __init__(self, compensate=True, **settings):
+        super().__init__(compensate=compensate, **settings)
+        self.parts = []
+        self._pass_start = None
+        self._retimed_parts = False
+        # Read once here: the dispatch thread never touches the disk
+        self._profile = load_profile() if self.compensate else None
+
+    def set_part_delay(self, part, delay):
+        """Change one part's tempo; takes effect at once during playback."""
+        part.delay = delay
+        if self._start_time is not None:
+            tempo = part.tempo
+            tempo.set_delay(delay, tempo.beat_at(self.clock.now() - self._pass_start))
+            self._retimed_parts = True
+            self._retimed()
+
+    def play_parts(self, parts, loop=None):
+        """Play every part together; returns when all have finished or playback is stopped."""
+        self._stop_event.clear()
+        self.wait_strategy.stats.reset()
+        log = self.log
+        self.parts = list(parts)
+        count = sum(len(part.compile(self.output)) for part in self.parts)
+        outputs = []
+        for part in self.parts:
+            output = part.output or self.output
+            if output not in outputs:
+                outputs.append(output)
+        # output -> measured send cost, or None
+        costs = {output: output_cost(output.name, profile=self._profile) if self.compensate else None
+                 for output in outputs}
+        log.info(f"[LOG] Ensemble: {len(self.parts)} parts, {count} events | Estimated Duration: "
+                 f"{max(part.timeline.duration(part.delay) for part in self.parts):.2f}s")
+        if log.verbosity >= LOG_SUMMARY:
+            log.start()
+
+        self._run_on_dispatch_thread(self._perform_parts, costs, count, loop)
+
+        log.info(f"[LOG] Timing ({self.wait_strategy.name}): {self.wait_strategy.stats}")
+        log.info(f"[LOG] Jitter: {self.telemetry.report()}")
+        log.info("[LOG] Playback finished or stopped.")
+
+    def _perform_parts(self, costs, count, loop):
+        """The merged timed loop; runs on the dispatch thread."""
+        with GCPaused():
+            start_time = self.clock.now()
+            self.telemetry = Telemetry(count if count > 0 else 4096, start_time)
+            self._start_time = start_time
+            self._pass_start = start_time
+            self.progress[0] = 0
+            self.progress[1] = 0
+            iteration = 0
+            # output -> {code: number of parts holding it}
+            held = {output: {} for output in costs}
+            while True:
+                looping = self.loop if loop is None else loop
+                # While this pass plays, render new variants of the humanized parts
+                variants = self._prepare_parts() if looping else None
+                if not self._dispatch_parts(held, costs, count):
+                    break
+                if not (self.loop if loop is None else loop):
+                    self._wait_for_pass_end()
+                    break
+                # The next pass starts once the longest part has ended
+                end = self._pass_end()
+                self._pass_start = end
+                if variants is not None:
+                    worker, result = variants
+                    worker.join()
+                    for part, timeline in result.items():
+                        part.timeline = timeline
+                iteration += 1
+                self.progress[1] = iteration
+                if self.log.verbosity >= LOG_SUMMARY:
+                    self.log.record(LOOP, iteration, 0, end - start_time)
+            self._start_time = None
+        for output in costs:
+            output.release_modifiers()
+
+    def _prepare_parts(self):
+        """Render the humanized parts again on a worker thread; returns (thread, {part: timeline}) or None."""
+        parts = [part for part in self.parts if part.varies]
+        if not parts:
+            return None
+        result = {}
+
+        def work():
+            # Started from the dispatch thread, so shed its real-time policy
+            normal_priority()
+            for part in parts:
+                result[part] = part.render(self.output)
+
+        worker = threading.Thread(target=work, daemon=True)
+        worker.start()
+        return worker, result
+
+    def _pass_end(self):
+        """When the current pass ends: once its longest part has."""
+        return self._pass_start + max(part.tempo.seconds(part.timeline.end_beat) for part in self.parts)
+
+    def _wait_for_pass_end(self):
+        """Wait out the current pass, following tempo changes made meanwhile."""
+        wake = self._wake
+        while True:
+            wake.seen = wake.retimes
+            if self.wait_strategy.wait_until(self._pass_end(), wake) or self._stop_event.is_set():
+                return
+
+    def _dispatch_parts(self, held, costs, count):
+        """Send one pass of every part against self._pass_start; False if stopped."""
+        log = self.log
+        log_events = log.verbosity >= LOG_EVENTS
+        log_summary = log.verbosity >= LOG_SUMMARY
+        record = log.record
+        progress = self.progress
+        parts = self.parts
+        pass_start = self._pass_start
+        start_time = self._start_time
+
+        frames = []
+        heap = []
+
+        def advance(i):
+            frame = next(frames[i], None)
+            if frame is not None:
+                beat, events = frame
+                heapq.heappush(heap, (parts[i].tempo.seconds(beat), i, beat, events))
+
+        for i, part in enumerate(parts):
+            part.tempo.reset(part.delay)
+            frames.append(iter_frames(part.timeline, part.tempo, part._hold))
+            advance(i)
+
+        wake = self._wake
+        sent = 0
+        n = 0
+        while heap:
+            wake.seen = wake.retimes
+            if self._retimed_parts:
+                # A part changed tempo: re-time every pending frame
+                self._retimed_parts = False
+                heap = [(parts[i].tempo.seconds(beat), i, beat, events) for _, i, beat, events in heap]
+                heapq.heapify(heap)
+            ts = heap[0][0]
+            target = pass_start + ts
+
+            # The devices are written one after another; start early enough
+            # for all of them. The heap holds one frame per part, so the
+            # frames due at this instant are found by scanning it.
+            due = {}
+            for entry in heap:
+                if entry[0] - ts <= FRAME_EPSILON:
+                    due.setdefault(parts[entry[1]].output or self.output, []).extend(entry[3])
+            lead = sum(costs[output].lead(output, events) for output, events in due.items()
+                       if costs[output] is not None)
+            if not self.wait_strategy.wait_until(target - lead, wake):
+                if self._stop_event.is_set():
+                    return False
+                # Woken by a tempo change: work out the next instant again
+                continue
+
+            # Everything due at this instant, merged per output device
+            merged = {}
+            while heap and heap[0][0] - ts <= FRAME_EPSILON:
+                _, i, _, events = heapq.heappop(heap)
+                output = parts[i].output or self.output
+                merged.setdefault(output, []).extend(events)
+                advance(i)
+            sends = []
+            for output, events in merged.items():
+                frame = _share_keys(events, held[output])
+                if frame:
+                    sends.append((output, frame))
+            for output, frame in sends:
+                self._send_frame(frame, target, output)
+                if log_events:
+                    for code, needs_shift, action in frame:
+                        record(action, code, needs_shift, target - start_time)
+                sent += len(frame)
+            if log_summary and not log_events and n % 10 == 0:
+                record(PROGRESS, sent, count, target - start_time)
+            n += 1
+            progress[0] = sent
+        return True
+
+    def close(self):
+        for part in self.parts:
+            part.close()
+        super().close()
+
+
+def _share_keys(events, held):
+    """Filter one device's merged frame so parts sharing a key do not cut each other off."""
+    frame = []
+    pressed = set()
+    for code, needs_shift, action in events:
+        count = held.get(code, 0)
+        if action == PRESS:
+            held[code] = count + 1
+            if code in pressed:
+                # Two parts strike the key at the same instant: once is enough
+                continue
+            pressed.add(code)
+            if count:
+                # Already down for another part: strike it again
+                frame.append((code, needs_shift, RELEASE))
+        elif action == RELEASE:
+            if count > 1:
+                held[code] = count - 1
+                continue
+            if not count:
+                continue
+            del held[code]
+        frame.append((code, needs_shift, action))
+    return frame
+
+
+def parse_part(spec, defaults):
+    """A Part from 'path[:bpm=N][:hold=F][:humanize][:seed=N][:backend=NAME]'."""
+    path, *options = spec.split(':')
+    settings = dict(defaults)
+    seed = None
+    for option in options:
+        key, _, value = option.partition('=')
+        if key == 'bpm':
+            settings['delay'] = 60.0 / float(value)
+        elif key == 'hold':
+            settings['hold_percent'] = float(value)
+        elif key == 'humanize':
+            settings['humanize'] = True
+        elif key == 'seed':
+            seed = int(value)
+        elif key == 'backend':
+            if value not in BACKENDS:
+                raise ValueError(f"unknown backend {value!r} in {spec!r}")
+            settings['output'] = value
+        else:
+            raise ValueError(f"unknown part option {key!r} in {spec!r}")
+    with open(path) as f:
+        sheet_content = f.read()
+    return Part(sheet_content, humanizer=Humanizer(seed=seed), name=path, **settings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play several sheets together on one clock.")
+    parser.add_argument("parts", nargs="+", metavar="PART",
+                        help="sheet file, optionally with :bpm=N :hold=F :humanize :seed=N :backend=NAME")
+    parser.add_argument("--bpm", type=float, default=120.0, help="tempo of parts that do not set one")
+    parser.add_argument("--hold", type=float, default=0.8, help="hold of parts that do not set one")
+    parser.add_argument("--humanize", action="store_true", help="humanize every part")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), help="shared output backend")
+    parser.add_argument("--loop", action="store_true", help="repeat until interrupted (Ctrl+C)")
+    parser.add_argument("--log", choices=list(VERBOSITY), default="summary", help="log verbosity")
+    parser.add_argument("--realtime", type=int, default=0, metavar="PRIORITY",
+                        help="SCHED_FIFO priority for the dispatch thread (needs root)")
+    args = parser.parse_args(argv)
+
+    defaults = dict(delay=60.0 / args.bpm, hold_percent=args.hold, humanize=args.humanize)
+    try:
+        parts = [parse_part(spec, defaults) for spec in args.parts]
+    except (OSError, ValueError) as err:
+        print(f"[ERR] {err}")
+        return 1
+    ensemble = Ensemble(backend=args.backend, verbosity=args.log, realtime=args.realtime)
+    try:
+        ensemble.play_parts(parts, loop=args.loop)
+    except KeyboardInterrupt:
+        print("[LOG] Interrupted.")
+        ensemble.stop()
+    finally:
+        ensemble.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
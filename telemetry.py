@@ -0,0 +1,93 @@
+import array
+import csv
+import json
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Telemetry:
+    """Scheduled vs. actual (post-write) timestamps of every dispatched event.
+
+    Buffers are preallocated for the expected event count and only grow
+    (by doubling) for streams of unknown length.
+    """
+
+    def __init__(self, capacity=4096, start_time=0.0):
+        capacity = max(1, capacity)
+        self.scheduled = array.array('d', bytes(8 * capacity))
+        self.actual = array.array('d', bytes(8 * capacity))
+        self.count = 0
+        self.start_time = start_time
+
+    def _grow(self):
+        self.scheduled.extend(array.array('d', bytes(8 * len(self.scheduled))))
+        self.actual.extend(array.array('d', bytes(8 * len(self.actual))))
+
+    def record(self, scheduled, actual, n=1):
+        """Store `n` events sharing one scheduled and one actual time."""
+        i = self.count
+        while i + n > len(self.scheduled):
+            self._grow()
+        for j in range(i, i + n):
+            self.scheduled[j] = scheduled
+            self.actual[j] = actual
+        self.count = i + n
+
+    def lateness(self):
+        return [self.actual[i] - self.scheduled[i] for i in range(self.count)]
+
+    def summary(self):
+        """Lateness statistics (seconds) for the recorded run."""
+        n = self.count
+        if not n:
+            return {'events': 0, 'mean': 0.0, 'p50': 0.0, 'p99': 0.0, 'max': 0.0,
+                    'chord_spread': 0.0, 'drift': 0.0}
+
+        late = self.lateness()
+        ordered = sorted(late)
+
+        # Chord spread: how far apart events that were scheduled for the
+        # same instant actually went out
+        spread = 0.0
+        first = 0
+        for i in range(1, n + 1):
+            if i == n or self.scheduled[i] != self.scheduled[first]:
+                frame_spread = self.actual[i - 1] - self.actual[first]
+                if frame_spread > spread:
+                    spread = frame_spread
+                first = i
+
+        return {
+            'events': n,
+            'mean': sum(late) / n,
+            'p50': _percentile(ordered, 0.50),
+            'p99': _percentile(ordered, 0.99),
+            'max': ordered[-1],
+            'chord_spread': spread,
+            'drift': late[-1] - late[0],
+        }
+
+    def report(self):
+        s = self.summary()
+        return (f"{s['events']} events | lateness mean {s['mean'] * 1e6:.0f}us "
+                f"p50 {s['p50'] * 1e6:.0f}us p99 {s['p99'] * 1e6:.0f}us max {s['max'] * 1e6:.0f}us | "
+                f"chord spread {s['chord_spread'] * 1e6:.0f}us | drift {s['drift'] * 1e6:+.0f}us")
+
+    def export(self, path):
+        """Write per-event timings to `path` as CSV, or JSON if it ends in .json."""
+        rows = [(self.scheduled[i] - self.start_time, self.actual[i] - self.start_time,
+                 self.actual[i] - self.scheduled[i]) for i in range(self.count)]
+        if str(path).endswith('.json'):
+            with open(path, 'w') as f:
+                json.dump({'summary': self.summary(),
+                           'events': [dict(zip(('scheduled', 'actual', 'lateness'), row)) for row in rows]}, f)
+        else:
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(('scheduled', 'actual', 'lateness'))
+                writer.writerows(rows)
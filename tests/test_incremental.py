@@ -0,0 +1,75 @@
+import pytest
+
+from backends import create_backend
+from timeline import IncrementalCompiler, clear_cache, compile_sheet, get_timeline, parse_score, render
+
+SHEET = """~90~
+a s d [fg] h
+j k l ; ?
+[qwe
+rty] u i ~120~ o
+p"""
+
+EDITS = [
+    SHEET,
+    # One line changed
+    SHEET.replace("j k l", "j [kl] z"),
+    # A line added in the middle, with a tempo mark
+    SHEET.replace("h\n", "h\n~60~ x c v\n"),
+    # A line deleted
+    SHEET.replace("j k l ; ?\n", ""),
+    # A chord closed on its own line
+    SHEET.replace("[qwe\nrty]", "[qwe]\nrty"),
+    "",
+]
+
+
+@pytest.fixture(scope="module")
+def resolve():
+    return create_backend('null').notes.get
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    clear_cache()
+    yield
+    clear_cache()
+
+
+def columns(score):
+    return (list(score.beats), list(score.slots), list(score.codes), list(score.shifts), score.marks,
+            score.end_beat, score.unknown)
+
+
+def timeline_columns(timeline):
+    return list(timeline), timeline.end_beat, timeline.unknown
+
+
+def test_each_edit_matches_a_full_parse(resolve):
+    compiler = IncrementalCompiler(resolve, 'null')
+    for sheet in EDITS:
+        assert columns(compiler.update(sheet)) == columns(parse_score(sheet, resolve))
+
+
+def test_rendered_timeline_matches_a_full_compile(resolve):
+    compiler = IncrementalCompiler(resolve, 'null')
+    for sheet in EDITS:
+        score = compiler.update(sheet)
+        full = timeline_columns(compile_sheet(sheet, 0.1, 0.8, False, resolve))
+        assert timeline_columns(render(score, 0.1, 0.8)) == full
+        # The stored Score is what get_timeline() renders
+        assert timeline_columns(get_timeline(sheet, 0.1, 0.8, False, resolve, 'null')) == full
+
+
+def test_unchanged_lines_are_not_parsed_again(resolve):
+    parsed = []
+
+    def counting(note):
+        parsed.append(note)
+        return resolve(note)
+
+    compiler = IncrementalCompiler(counting, 'null')
+    compiler.update("a s d\nf g h")
+    parsed.clear()
+    compiler.update("a s d\nf g j")
+    assert parsed == ["f", "g", "j"]
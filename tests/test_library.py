@@ -0,0 +1,81 @@
+import glob
+import os
+
+import pytest
+
+from auto import PianoPlayer
+from library import Library
+
+
+@pytest.fixture
+def library(tmp_path):
+    return Library(str(tmp_path))
+
+
+@pytest.fixture
+def player():
+    player = PianoPlayer(verbosity='off', backend='null', compensate=False)
+    yield player
+    player.close()
+
+
+def compiled_files(library):
+    return glob.glob(os.path.join(library.compiled_dir, "*.tl"))
+
+
+def test_save_and_read(library):
+    entry = library.save_async("Song", "a s d", bpm=120, hold=0.5)
+    library.flush()
+    assert library.read("Song") == "a s d"
+    assert (entry["notes"], entry["beats"], entry["duration"]) == (3, 3, 1.5)
+    # The index survives a reload
+    assert Library(library.path).entries["Song"]["hash"] == entry["hash"]
+
+
+def test_saving_a_title_again_overwrites_its_sheet(library):
+    first = library.save_async("Song", "a s d")
+    second = library.save_async("Song", "f g")
+    library.flush()
+    assert second["file"] == first["file"]
+    assert library.read("Song") == "f g"
+    assert len(os.listdir(library.sheets_dir)) == 1
+
+
+def test_titles_that_sanitize_alike_get_their_own_files(library):
+    library.save_async("Song?", "a")
+    library.save_async("Song!", "s")
+    library.flush()
+    assert library.read("Song?") == "a"
+    assert library.read("Song!") == "s"
+
+
+def test_delete_removes_the_sheet(library):
+    library.save_async("Song", "a s d")
+    library.delete_async("Song")
+    library.flush()
+    assert "Song" not in library.entries
+    assert os.listdir(library.sheets_dir) == []
+
+
+def test_compiled_timelines_are_kept_only_for_saved_sheets(library, player):
+    library.compiled("a s d", player)
+    library.flush()
+    assert compiled_files(library) == []
+
+    library.save_async("Song", "a s d")
+    timeline = library.compiled("a s d", player)
+    library.flush()
+    assert len(compiled_files(library)) == 1
+    # Loaded back from disk on the next play
+    assert list(library.compiled("a s d", player)) == list(timeline)
+
+    library.save_async("Song", "f g")
+    library.flush()
+    assert compiled_files(library) == []
+
+
+def test_stale_compiled_timelines_are_pruned_on_load(library):
+    stale = os.path.join(library.compiled_dir, "0123.null.95000.8000.tl")
+    open(stale, "wb").close()
+    Library(library.path).flush()
+    assert not os.path.exists(stale)
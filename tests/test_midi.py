@@ -0,0 +1,92 @@
+import struct
+
+import pytest
+
+from backends import create_backend
+from cli import main
+from midi import HIGHEST_NOTE, LOWEST_NOTE, midi_sheet, midi_timeline, note_char, read_midi
+from timeline import PRESS, REST, RELEASE, scan_sheet
+
+
+def varlen(value):
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.insert(0, 0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(out)
+
+
+def tempo_event(delta, microseconds):
+    return varlen(delta) + b"\xff\x51\x03" + microseconds.to_bytes(3, "big")
+
+
+def note_event(delta, status, note, velocity=64):
+    return varlen(delta) + bytes([status, note, velocity])
+
+
+def write_midi(path, track, ppq=480):
+    track += b"\x00\xff\x2f\x00"
+    with open(path, "wb") as f:
+        f.write(b"MThd" + struct.pack(">IHHH", 6, 0, 1, ppq))
+        f.write(b"MTrk" + struct.pack(">I", len(track)) + track)
+    return str(path)
+
+
+@pytest.fixture
+def song_path(tmp_path):
+    # Middle C for a quarter note at 120 BPM, a quarter rest, then C0 (out
+    # of range, moved up to C2) for a quarter note at 240 BPM
+    track = (tempo_event(0, 500000)
+             + note_event(0, 0x90, 60) + note_event(480, 0x80, 60)
+             + tempo_event(480, 250000)
+             + note_event(0, 0x90, 12) + note_event(480, 0x90, 12, 0))
+    return write_midi(tmp_path / "song.mid", track)
+
+
+@pytest.fixture(scope="module")
+def resolve():
+    return create_backend('null').notes.get
+
+
+def test_note_mapping():
+    assert note_char(LOWEST_NOTE) == "1"
+    assert note_char(LOWEST_NOTE + 1) == "!"
+    assert note_char(60) == "t"
+    assert note_char(HIGHEST_NOTE) == "m"
+    # Out-of-range notes move by whole octaves
+    assert note_char(LOWEST_NOTE - 12) == note_char(LOWEST_NOTE)
+    assert note_char(HIGHEST_NOTE + 1) == note_char(HIGHEST_NOTE - 11)
+
+
+def test_read_midi(song_path):
+    song = read_midi(song_path)
+    assert song.notes == [(0, 480, 60), (960, 1440, 12)]
+    assert song.tempos == [(0, 500000), (960, 250000)]
+    assert song.bpm == 120
+
+
+def test_timeline_keeps_note_lengths_and_tempo(song_path, resolve):
+    timeline = midi_timeline(read_midi(song_path), resolve)
+    events = [(beat, gate, code, action) for beat, gate, _, code, _, action in timeline]
+    assert [(beat, code, action) for beat, _, code, action in events if action == PRESS] == [
+        (0.0, resolve("t")[0], PRESS), (2.0, resolve("1")[0], PRESS)]
+    assert [gate for _, gate, _, action in events if action == RELEASE] == [1.0, 1.0]
+    assert timeline.tempo_marks() == [(0.0, 0.5), (2.0, 0.25)]
+
+
+def test_bpm_scales_every_tempo(song_path, resolve):
+    timeline = midi_timeline(read_midi(song_path), resolve, bpm=60)
+    assert timeline.tempo_marks() == [(0.0, 1.0), (2.0, 0.5)]
+
+
+def test_cli_applies_bpm_to_midi(song_path, capsys):
+    assert main([song_path, "--bpm", "60", "--dry-run", "--no-lead", "--log", "off"]) == 0
+    assert "Tempo marks: 60 120 BPM" in capsys.readouterr().out
+
+
+def test_sheet_writes_rests_as_empty_chords(song_path):
+    sheet = midi_sheet(read_midi(song_path), grid=1)
+    assert REST in sheet.split()
+    steps = [step for step in scan_sheet(sheet) if not isinstance(step, float)]
+    assert steps == [["t"], [], ["1"]]
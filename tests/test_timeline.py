@@ -0,0 +1,92 @@
+import pytest
+
+from backends import create_backend
+from humanize import Humanizer
+from timeline import PRESS, RELEASE, TempoMap, compile_sheet, iter_frames
+
+SHEET = "a s d [fg] h j k l"
+
+
+@pytest.fixture(scope="module")
+def resolve():
+    return create_backend('null').notes.get
+
+
+def play(timeline, tempo, hold, change=None):
+    """Run iter_frames, calling change(frame number) before each frame is read; returns [(beat, frame)]."""
+    frames = []
+    source = iter_frames(timeline, tempo, lambda: hold[0])
+    while True:
+        if change is not None:
+            change(len(frames))
+        frame = next(source, None)
+        if frame is None:
+            return frames
+        frames.append(frame)
+
+
+def assert_in_order(frames, timeline):
+    beats = [beat for beat, _ in frames]
+    assert beats == sorted(beats)
+    sent = [event for _, frame in frames for event in frame]
+    assert len(sent) == len(timeline)
+    # Every key still goes down before it comes up again
+    down = set()
+    for code, _, action in sent:
+        if action == PRESS:
+            assert code not in down
+            down.add(code)
+        else:
+            assert code in down
+            down.discard(code)
+
+
+def test_frames_follow_compiled_order(resolve):
+    timeline = compile_sheet(SHEET, 0.5, 0.8, False, resolve)
+    frames = play(timeline, TempoMap(0.5), [0.8])
+    assert_in_order(frames, timeline)
+    assert frames[0] == (0.0, [(97, False, PRESS)])
+
+
+@pytest.mark.parametrize("new_hold", [3.0, 0.05])
+def test_live_hold_change_keeps_order(resolve, new_hold):
+    timeline = compile_sheet(SHEET, 0.5, 0.2, False, resolve)
+    hold = [0.2]
+
+    def change(n):
+        if n == 2:
+            hold[0] = new_hold
+
+    assert_in_order(play(timeline, TempoMap(0.5), hold, change), timeline)
+
+
+def test_longer_hold_moves_releases_after_later_presses(resolve):
+    timeline = compile_sheet("a s", 0.5, 0.2, False, resolve)
+    frames = play(timeline, TempoMap(0.5), [3.0])
+    assert [(beat, [action for _, _, action in frame]) for beat, frame in frames] == [
+        (0.0, [PRESS]), (1.0, [PRESS]), (3.0, [RELEASE]), (4.0, [RELEASE])]
+
+
+def test_live_tempo_change_keeps_order(resolve):
+    # At a very fast tempo the minimum hold spans many beats, so releases
+    # move past presses listed after them
+    timeline = compile_sheet(SHEET, 0.5, 0.2, False, resolve)
+    tempo = TempoMap(0.5)
+
+    def change(n):
+        if n == 2:
+            tempo.set_delay(0.001, 1.0)
+
+    assert_in_order(play(timeline, tempo, [0.2], change), timeline)
+
+
+def test_humanized_live_hold_change_keeps_order(resolve):
+    timeline = compile_sheet(SHEET * 8, 0.1, 0.5, Humanizer(seed=3), resolve)
+    assert any(timeline.offsets)
+    hold = [0.5]
+
+    def change(n):
+        if n == 10:
+            hold[0] = 1.0
+
+    assert_in_order(play(timeline, TempoMap(0.1), hold, change), timeline)
@@ -0,0 +1,670 @@
+import array
+import hashlib
+import heapq
+import random
+import threading
+from bisect import insort
+from collections import OrderedDict, deque
+from itertools import chain
+
+from humanize import as_humanizer
+
+# Event action bits stored in Timeline.actions
+RELEASE = 0
+PRESS = 1
+TEMPO = 2  # tempo mark: the event's gate holds the new seconds-per-beat
+
+# Tempo marks in a sheet look like ~120~ (beats per minute)
+TEMPO_MARK = '~'
+
+# A rest: an empty chord, one beat with no notes
+REST = '[]'
+
+# Beats per line when writing a sheet
+BEATS_PER_LINE = 16
+
+# Safety minimum for how long a key is held (seconds)
+MIN_HOLD = 0.015
+
+# Shifted symbols and the base key they live on
+SPECIAL_CHARACTERS = {
+    '!': '1', '@': '2', '#': '3', '$': '4', '%': '5',
+    '^': '6', '&': '7', '*': '8', '(': '9', ')': '0',
+    '_': '-', '+': '=', '{': '[', '}': ']', ':': ';',
+    '"': "'", '<': ',', '>': '.', '?': '/'
+}
+
+CACHE_SIZE = 16
+
+# Events closer together than this are treated as one scheduled instant
+FRAME_EPSILON = 1e-6
+
+
+def is_note(char):
+    return char.isalnum() or char in SPECIAL_CHARACTERS
+
+
+# Column names and array typecodes, in the order they are laid out in a
+# flat buffer (widest items first, so every column stays aligned)
+COLUMNS = (('beats', 'd'), ('gates', 'f'), ('offsets', 'f'), ('codes', 'H'), ('shifts', 'B'), ('actions', 'B'))
+
+
+class Timeline:
+    """Compiled sheet: parallel arrays of key events, in beats.
+
+    Times are kept in beats rather than seconds, so tempo and hold can be
+    changed while a timeline plays. An event happens at
+    tempo.seconds(beat + gate * hold_percent + offset): presses have a zero
+    gate, releases carry their note's hold length in beats (at 100% hold),
+    and `offset` holds the humanize jitter in beats, so it scales with the
+    tempo too. Events are ordered by the delay/hold the timeline was
+    compiled with; iter_frames() restores the order for the live settings.
+    """
+    __slots__ = ('beats', 'gates', 'offsets', 'codes', 'shifts', 'actions', 'end_beat', 'unknown')
+
+    def __init__(self):
+        self.beats = array.array('d')    # anchor position in beats
+        self.gates = array.array('f')    # hold length in beats (releases), new delay (tempo marks)
+        self.offsets = array.array('f')  # humanize offset in beats
+        self.codes = array.array('H')    # backend-native keycode
+        self.shifts = array.array('B')   # 1 if the note needs shift
+        self.actions = array.array('B')  # PRESS / RELEASE / TEMPO
+        self.end_beat = 0.0              # end of the last beat
+        self.unknown = ''                # symbols that were skipped
+
+    def __len__(self):
+        return len(self.beats)
+
+    def __iter__(self):
+        return zip(self.beats, self.gates, self.offsets, self.codes, self.shifts, self.actions)
+
+    def tempo_marks(self):
+        return [(beat, gate) for beat, gate, action in zip(self.beats, self.gates, self.actions) if action == TEMPO]
+
+    def duration(self, delay):
+        """Seconds to the end of the last beat when started at `delay` seconds per beat."""
+        tempo = TempoMap(delay)
+        for beat, mark_delay in self.tempo_marks():
+            tempo.set_delay(mark_delay, beat)
+        return tempo.seconds(self.end_beat)
+
+    def nbytes(self):
+        return sum(a.itemsize * len(a) for a in (self.beats, self.gates, self.offsets,
+                                                 self.codes, self.shifts, self.actions))
+
+    def write_into(self, buf):
+        """Copy the columns back to back into a writable buffer of at least nbytes()."""
+        buf = memoryview(buf).cast('B')
+        pos = 0
+        for name, _ in COLUMNS:
+            raw = memoryview(getattr(self, name)).cast('B')
+            buf[pos:pos + len(raw)] = raw
+            pos += len(raw)
+
+    @classmethod
+    def from_buffer(cls, buf, count, end_beat=0.0, unknown=''):
+        """Zero-copy Timeline over a buffer filled by write_into(); columns are memoryviews."""
+        timeline = cls.__new__(cls)
+        buf = memoryview(buf).cast('B')
+        pos = 0
+        for name, typecode in COLUMNS:
+            size = count * array.array(typecode).itemsize
+            setattr(timeline, name, buf[pos:pos + size].cast(typecode))
+            pos += size
+        timeline.end_beat = end_beat
+        timeline.unknown = unknown
+        return timeline
+
+
+class TempoMap:
+    """Maps beats to seconds; re-timed in O(1) while playing.
+
+    The map is one linear segment (beat0, time0, delay). A tempo change
+    re-anchors it at the beat where it takes effect, so the mapping stays
+    continuous and nothing already scheduled jumps. The segment is swapped
+    as a single tuple, so another thread can retime it safely.
+    """
+
+    def __init__(self, delay):
+        self.segment = (0.0, 0.0, delay)
+
+    @property
+    def delay(self):
+        return self.segment[2]
+
+    def seconds(self, beat):
+        beat0, time0, delay = self.segment
+        return time0 + (beat - beat0) * delay
+
+    def beat_at(self, seconds):
+        beat0, time0, delay = self.segment
+        return beat0 + (seconds - time0) / delay
+
+    def set_delay(self, delay, beat):
+        """Use `delay` seconds per beat from `beat` onward."""
+        self.segment = (beat, self.seconds(beat), delay)
+
+    def reset(self, delay):
+        self.segment = (0.0, 0.0, delay)
+
+
+def scan_sheet(sheet_content, unknown=None):
+    """Yield the notes of each beat: a one-note list, or a chord's notes ([] for the rest `[]`).
+
+    A tempo mark (~120~) yields its BPM as a float instead. Characters that
+    are neither notes nor layout are skipped and, if an `unknown` set is
+    given, added to it.
+    """
+    index = 0
+    notes = sheet_content
+    while index < len(notes):
+        char = notes[index]
+
+        # Sanitization: Ignore spaces and bar lines as timing units
+        if char.isspace() or char == '|':
+            index += 1
+            continue
+
+        if is_note(char):
+            # SINGLE NOTE
+            yield [char]
+        elif char == '[':
+            # CHORD
+            chord_notes = []
+            index += 1
+            while index < len(notes) and notes[index] != ']':
+                if not notes[index].isspace():
+                    if is_note(notes[index]):
+                        chord_notes.append(notes[index])
+                    elif unknown is not None:
+                        unknown.add(notes[index])
+                index += 1
+            yield chord_notes
+        elif char == TEMPO_MARK:
+            # TEMPO MARK
+            end = notes.find(TEMPO_MARK, index + 1)
+            try:
+                bpm = float(notes[index + 1:end])
+            except ValueError:
+                bpm = 0
+            if end < 0 or bpm <= 0:
+                if unknown is not None:
+                    unknown.add(char)
+            else:
+                yield bpm
+                index = end
+        elif unknown is not None:
+            unknown.add(char)
+        index += 1
+
+
+def release_beat(beat, gate, hold_percent, delay):
+    """Beat a release lands on, with the safety minimum hold applied."""
+    return beat + max(gate * hold_percent, MIN_HOLD / delay)
+
+
+class Score:
+    """Note-level form of a sheet: resolved for one backend, not yet timed.
+
+    render() turns it into a Timeline for a tempo, hold and humanization;
+    loop variants and retimed copies re-render the same Score instead of
+    parsing the sheet again.
+    """
+    __slots__ = ('beats', 'slots', 'codes', 'shifts', 'marks', 'end_beat', 'unknown')
+
+    def __init__(self):
+        self.beats = array.array('d')  # beat the note starts on
+        self.slots = array.array('B')  # position within its chord
+        self.codes = array.array('H')  # backend-native keycode
+        self.shifts = array.array('B')  # 1 if the note needs shift
+        self.marks = []                 # tempo marks as (beat, seconds per beat)
+        self.end_beat = 0.0
+        self.unknown = ''
+
+    def __len__(self):
+        return len(self.beats)
+
+    def duration(self, delay):
+        """Seconds to the end of the last beat when started at `delay` seconds per beat."""
+        tempo = TempoMap(delay)
+        for beat, mark_delay in self.marks:
+            tempo.set_delay(mark_delay, beat)
+        return tempo.seconds(self.end_beat)
+
+
+def _schedule(items, delay, hold_percent, early):
+    """Turn notes into time-ordered events in the Timeline layout.
+
+    `items` yields, in beat order, (beat, code, needs_shift, press_offset,
+    hold_factor, release_jitter) per note and (beat, delay) per tempo mark;
+    the offsets are in seconds and are stored in beats of the tempo in
+    effect at the note. Only events inside the look-ahead window are
+    buffered: nothing scheduled later can land more than `early` seconds
+    before its beat, so once a new beat is reached everything older is
+    emitted. The order is worked out for `delay`/`hold_percent`.
+    """
+    # Reference tempo used to order events
+    tempo = TempoMap(delay)
+    heap = []
+    seq = 0
+    current = 0.0
+    for item in items:
+        beat = item[0]
+        if beat > current:
+            horizon = tempo.seconds(beat) - early
+            while heap and heap[0][0] <= horizon:
+                yield heapq.heappop(heap)[2:]
+            current = beat
+
+        if len(item) == 2:
+            mark_delay = item[1]
+            heapq.heappush(heap, (tempo.seconds(beat), seq, beat, mark_delay, 0.0, 0, 0, TEMPO))
+            tempo.set_delay(mark_delay, beat)
+            seq += 1
+            continue
+
+        _, code, needs_shift, press_offset, gate, release_jitter = item
+        note_delay = tempo.delay
+        press_offset /= note_delay
+        release_offset = press_offset + release_jitter / note_delay
+        release_time = tempo.seconds(release_beat(beat, gate, hold_percent, note_delay) + release_offset)
+        heapq.heappush(heap, (tempo.seconds(beat + press_offset), seq, beat, 0.0, press_offset,
+                              code, needs_shift, PRESS))
+        heapq.heappush(heap, (release_time, seq + 1, beat, gate, release_offset, code, needs_shift, RELEASE))
+        seq += 2
+
+    while heap:
+        yield heapq.heappop(heap)[2:]
+
+
+def optimize(events):
+    """Drop redundant key events from a time-ordered event stream.
+
+    A key can only be down once, so per keycode:
+    - a duplicate note (the same key twice in one chord) is dropped; the
+      key stays down until the later of the two releases
+    - a press that lands while the key is still held (long holds, release
+      jitter) truncates the earlier note: its release moves to the new
+      press, in the same frame, so the key is struck again instead of being
+      released under the new note
+    - releases of keys that are not down are dropped
+    Truncated releases have a zero gate, so they stay on the press they
+    precede whatever the live hold is set to.
+    """
+    held = {}   # code -> beat of the note holding it down
+    skip = {}   # (code, beat) -> releases still to drop
+    for event in events:
+        beat, _, offset, code, needs_shift, action = event
+        if action == PRESS:
+            if code in held:
+                note_beat = held[code]
+                skip[code, note_beat] = skip.get((code, note_beat), 0) + 1
+                if note_beat == beat:
+                    continue
+                yield beat, 0.0, offset, code, needs_shift, RELEASE
+            held[code] = beat
+        elif action == RELEASE:
+            pending = skip.get((code, beat))
+            if pending:
+                if pending == 1:
+                    del skip[code, beat]
+                else:
+                    skip[code, beat] = pending - 1
+                continue
+            if held.get(code) != beat:
+                continue
+            del held[code]
+        yield event
+
+
+class SheetStream:
+    """Events in the Timeline layout, parsed lazily and emitted in time order.
+
+    Humanized offsets are drawn note by note as the parser reaches them.
+    The order is worked out for `delay`/`hold_percent`. `end_beat` and
+    `unknown` (skipped symbols) are set once the stream is exhausted.
+    """
+
+    def __init__(self, sheet_content, delay, hold_percent, humanize, resolve, rng=random):
+        self.sheet_content = sheet_content
+        self.delay = delay
+        self.hold_percent = hold_percent
+        self.humanizer = as_humanizer(humanize, rng)
+        self.resolve = resolve
+        self.end_beat = None
+        self.unknown = None
+
+    def _notes(self, unknown):
+        humanizer, resolve = self.humanizer, self.resolve
+        drift = 0.0
+        beat = 0.0
+        for chord in scan_sheet(self.sheet_content, unknown):
+            if isinstance(chord, float):
+                yield beat, 60.0 / chord
+                continue
+            if humanizer is not None:
+                drift = humanizer.step_drift(drift)
+            for i, note in enumerate(chord):
+                resolved = resolve(note)
+                if resolved is None:
+                    unknown.add(note)
+                    continue
+                code, needs_shift = resolved
+                if humanizer is None:
+                    yield beat, code, needs_shift, 0.0, 1.0, 0.0
+                else:
+                    press, factor, release_jitter = humanizer.note(i)
+                    yield beat, code, needs_shift, press + drift * self.delay, factor, release_jitter
+            beat += 1.0
+        self.end_beat = beat
+
+    def __iter__(self):
+        unknown = set()
+        early = self.humanizer.max_early(self.delay) if self.humanizer is not None else 0.0
+        yield from optimize(_schedule(self._notes(unknown), self.delay, self.hold_percent, early))
+        self.unknown = ''.join(sorted(unknown))
+
+
+def parse_score(sheet_content, resolve):
+    """Parse sheet text into a Score.
+
+    `resolve(note)` returns a backend-native (code, needs_shift) pair, or None
+    for notes the backend cannot play (they still take up their beat).
+    """
+    score = Score()
+    beats, slots, codes, shifts = score.beats, score.slots, score.codes, score.shifts
+    unknown = set()
+    beat = 0.0
+    for chord in scan_sheet(sheet_content, unknown):
+        if isinstance(chord, float):
+            score.marks.append((beat, 60.0 / chord))
+            continue
+        for i, note in enumerate(chord):
+            resolved = resolve(note)
+            if resolved is None:
+                unknown.add(note)
+                continue
+            beats.append(beat)
+            slots.append(min(i, 255))
+            codes.append(resolved[0])
+            shifts.append(resolved[1])
+        beat += 1.0
+    score.end_beat = beat
+    score.unknown = ''.join(sorted(unknown))
+    return score
+
+
+def _logical_lines(sheet_content):
+    """Split a sheet into lines, keeping a chord or tempo mark that spans lines in one piece."""
+    pending = ''
+    for line in sheet_content.split('\n'):
+        pending += line
+        if pending.rfind('[') > pending.rfind(']') or pending.count(TEMPO_MARK) % 2:
+            pending += '\n'
+            continue
+        yield pending
+        pending = ''
+    if pending:
+        yield pending
+
+
+class IncrementalCompiler:
+    """Parses a sheet that is being edited, re-parsing only the lines that changed.
+
+    Each line is parsed into its own Score once and kept while the line
+    exists; update() splices the line Scores together at their beat
+    positions. The result is stored in the Score cache, so get_timeline()
+    for the same text only has to render.
+    """
+
+    def __init__(self, resolve, backend):
+        self.resolve = resolve
+        self.backend = backend
+        self._lines = {}  # line text -> Score of that line alone
+
+    def update(self, sheet_content):
+        """Return the Score of `sheet_content`, reusing the lines seen last time."""
+        score = Score()
+        lines = {}
+        unknown = set()
+        beat = 0.0
+        for text in _logical_lines(sheet_content):
+            part = lines.get(text) or self._lines.get(text)
+            if part is None:
+                part = parse_score(text, self.resolve)
+            lines[text] = part
+            if part.beats:
+                score.beats.extend([beat + b for b in part.beats])
+                score.slots.extend(part.slots)
+                score.codes.extend(part.codes)
+                score.shifts.extend(part.shifts)
+            score.marks.extend((beat + b, delay) for b, delay in part.marks)
+            unknown.update(part.unknown)
+            beat += part.end_beat
+        score.end_beat = beat
+        score.unknown = ''.join(sorted(unknown))
+        # Lines that were deleted are dropped with the old table
+        self._lines = lines
+        _store(_scores, (sheet_hash(sheet_content), self.backend), score)
+        return score
+
+
+def _score_items(score, press, factors, releases):
+    marks = score.marks
+    m = 0
+    beats, codes, shifts = score.beats, score.codes, score.shifts
+    for i in range(len(beats)):
+        beat = beats[i]
+        while m < len(marks) and marks[m][0] <= beat:
+            yield marks[m]
+            m += 1
+        if press is None:
+            yield beat, codes[i], shifts[i], 0.0, 1.0, 0.0
+        else:
+            yield beat, codes[i], shifts[i], press[i], factors[i], releases[i]
+    yield from marks[m:]
+
+
+def render(score, delay, hold_percent, humanize=None, rng=random):
+    """Time a Score into a Timeline of non-overlapping key events (see optimize()).
+
+    With `humanize` (a Humanizer, or True for default settings drawn from
+    `rng`), every note's randomness is drawn in one batch up front.
+    """
+    humanizer = as_humanizer(humanize, rng)
+    press = factors = releases = None
+    early = 0.0
+    if humanizer is not None:
+        press, factors, releases = humanizer.batch(score.slots, score.beats, score.end_beat, delay)
+        if press:
+            early = max(0.0, -min(press))
+
+    events = _schedule(_score_items(score, press, factors, releases), delay, hold_percent, early)
+    return _collect(events, score.end_beat, score.unknown)
+
+
+def _collect(events, end_beat, unknown):
+    timeline = Timeline()
+    columns = (timeline.beats, timeline.gates, timeline.offsets, timeline.codes, timeline.shifts, timeline.actions)
+    appends = [column.append for column in columns]
+    for event in optimize(events):
+        for append, value in zip(appends, event):
+            append(value)
+    timeline.end_beat = end_beat
+    timeline.unknown = unknown
+    return timeline
+
+
+def timeline_from_notes(notes, marks, end_beat, delay, hold_percent=1.0, unknown=''):
+    """Build a Timeline from notes with their own lengths (e.g. from a MIDI file).
+
+    `notes` yields (beat, code, needs_shift, length in beats) in beat order,
+    `marks` is a list of (beat, seconds per beat). At 100% hold every note
+    is held for exactly its length.
+    """
+    def items():
+        m = 0
+        for beat, code, needs_shift, length in notes:
+            while m < len(marks) and marks[m][0] <= beat:
+                yield marks[m]
+                m += 1
+            yield beat, code, needs_shift, 0.0, length, 0.0
+        yield from marks[m:]
+
+    return _collect(_schedule(items(), delay, hold_percent, 0.0), end_beat, unknown)
+
+
+def format_sheet(steps, tempo=None):
+    """Lay out sheet steps (notes, '[chords]', rests, tempo marks) as sheet text.
+
+    `tempo` (BPM) is written as a tempo mark on its own first line.
+    """
+    lines = [' '.join(steps[i:i + BEATS_PER_LINE]) for i in range(0, len(steps), BEATS_PER_LINE)]
+    if tempo is not None:
+        lines.insert(0, f"{TEMPO_MARK}{tempo:g}{TEMPO_MARK}")
+    return '\n'.join(lines) + '\n'
+
+
+def compile_sheet(sheet_content, delay, hold_percent, humanize, resolve, rng=random):
+    """Parse sheet text into a Timeline (parse_score() then render()).
+
+    `humanize` is False, True, or a Humanizer; with True the randomness
+    comes from `rng` (pass a seeded random.Random for reproducible output).
+    """
+    return render(parse_score(sheet_content, resolve), delay, hold_percent, humanize, rng)
+
+
+def iter_frames(events, tempo, hold_percent, beat_offset=0.0):
+    """Group timeline events into (beat, [(code, needs_shift, action), ...]) frames, in time order.
+
+    A frame happens at tempo.seconds(beat). The caller evaluates that when
+    it starts waiting for the frame and again after every tempo change
+    during the wait; `hold_percent()` is read per release.
+
+    The timeline is ordered for the hold and tempo it was compiled with,
+    so a live change of either can move a release ahead of events listed
+    before it. Events are therefore re-sorted by their live beat: one is
+    only emitted once no event still to be read can land before it.
+    Presses and tempo marks keep their order, and a release never lands
+    before its press, so that point is the earlier of the last press or
+    mark read and the press of the oldest note whose release has not been
+    read yet. Tempo marks close the pending frame and then re-time `tempo`.
+    """
+    # (beat, seq, (code, needs_shift, action)) by beat; a tempo mark has its delay in place of the event
+    pending = deque()
+    append, popleft = pending.append, pending.popleft
+    # code -> beat of each press whose release is still to be read; presses
+    # arrive in beat order, so the first entry is the oldest
+    sounding = {}
+    seq = 0
+    frame = []
+    frame_beat = 0.0
+    bound = float('-inf')
+    # A final None drains what is still pending
+    for event in chain(events, (None,)):
+        if event is None:
+            bound = float('inf')
+        else:
+            beat, gate, offset, code, needs_shift, action = event
+            beat += beat_offset
+            if action == PRESS:
+                beat += offset
+                # Re-insert, so a key struck again moves to the end
+                sounding.pop(code, None)
+                sounding[code] = beat
+                bound = beat
+                entry = (beat, seq, (code, needs_shift, PRESS))
+            elif action == RELEASE:
+                sounding.pop(code, None)
+                entry = (release_beat(beat, gate, hold_percent(), tempo.delay) + offset, seq,
+                         (code, needs_shift, RELEASE))
+            else:
+                bound = beat
+                entry = (beat, seq, gate)
+            seq += 1
+            if not pending or entry[0] >= pending[-1][0]:
+                append(entry)
+            else:
+                # Moved ahead of events read before it by a live hold or tempo change
+                insort(pending, entry)
+            if pending[0][0] >= bound:
+                continue
+            # Everything before the earliest beat an unread event can land on is final
+            if sounding:
+                oldest = next(iter(sounding.values()))
+                if oldest < bound:
+                    bound = oldest
+
+        while pending and pending[0][0] < bound:
+            beat, _, item = popleft()
+            if item.__class__ is float:
+                if frame:
+                    yield frame_beat, frame
+                    frame = []
+                tempo.set_delay(item, beat)
+            elif not frame:
+                frame_beat = beat
+                frame = [item]
+            elif (beat - frame_beat) * tempo.delay > FRAME_EPSILON:
+                yield frame_beat, frame
+                frame_beat = beat
+                frame = [item]
+            else:
+                frame.append(item)
+    if frame:
+        yield frame_beat, frame
+
+
+_cache = OrderedDict()
+_scores = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def sheet_hash(sheet_content):
+    return hashlib.sha1(sheet_content.encode('utf-8')).hexdigest()
+
+
+def _cached(cache, key, build):
+    with _cache_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+            return value
+    value = build()
+    _store(cache, key, value)
+    return value
+
+
+def _store(cache, key, value):
+    with _cache_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > CACHE_SIZE:
+            cache.popitem(last=False)
+
+
+def get_score(sheet_content, resolve, backend):
+    """Return the parsed Score of a sheet for a backend, reusing a cached one."""
+    return _cached(_scores, (sheet_hash(sheet_content), backend),
+                   lambda: parse_score(sheet_content, resolve))
+
+
+def get_timeline(sheet_content, delay, hold_percent, humanize, resolve, backend, rng=random):
+    """Return a compiled Timeline, reusing a cached one when possible.
+
+    The sheet is parsed once per backend; each new tempo, hold or
+    humanization only re-renders its Score. Humanized timelines are never
+    cached: every call draws a fresh performance (reproducible through a
+    seeded Humanizer or rng, not through the cache).
+    """
+    if humanize:
+        return render(get_score(sheet_content, resolve, backend), delay, hold_percent, humanize, rng)
+    key = (sheet_hash(sheet_content), delay, hold_percent, backend)
+    return _cached(_cache, key, lambda: render(get_score(sheet_content, resolve, backend),
+                                               delay, hold_percent, None, rng))
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+        _scores.clear()
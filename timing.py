@@ -0,0 +1,189 @@
+import ctypes
+import ctypes.util
+import time
+
+# Longest single sleep, so stop() is noticed promptly
+STOP_POLL = 0.05
+
+# Linux clock_nanosleep with an absolute CLOCK_MONOTONIC deadline
+CLOCK_MONOTONIC = getattr(time, 'CLOCK_MONOTONIC', 1)
+TIMER_ABSTIME = 1
+
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    _clock_nanosleep = _libc.clock_nanosleep
+    _clock_nanosleep.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.POINTER(_timespec), ctypes.POINTER(_timespec)]
+except (OSError, AttributeError, TypeError):
+    _clock_nanosleep = None
+
+
+class SystemClock:
+    """Real time: perf_counter() and time.sleep()."""
+    virtual = False
+    now = staticmethod(time.perf_counter)
+    sleep = staticmethod(time.sleep)
+
+
+class VirtualClock:
+    """Simulated time for tests: sleep() advances the clock instantly.
+
+    Injected into PianoPlayer, a whole performance runs in milliseconds and
+    produces exactly the timestamps a perfect real-time run would.
+    """
+    virtual = True
+
+    def __init__(self, start=0.0):
+        self.time = start
+
+    def now(self):
+        return self.time
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.time += seconds
+
+
+SYSTEM_CLOCK = SystemClock()
+
+
+class WaitStats:
+    """Overshoot (wake-up lateness) statistics for one wait strategy."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.late = 0  # waits that overshot by more than 1 ms
+
+    def add(self, overshoot):
+        self.count += 1
+        self.total += overshoot
+        if overshoot > self.max:
+            self.max = overshoot
+        if overshoot > 0.001:
+            self.late += 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self):
+        return {'count': self.count, 'mean': self.mean, 'max': self.max, 'late': self.late}
+
+    def __str__(self):
+        return (f"{self.count} waits | mean overshoot {self.mean * 1e6:.0f}us | "
+                f"max {self.max * 1e6:.0f}us | >1ms: {self.late}")
+
+
+class WaitStrategy:
+    """Blocks until a clock deadline; returns False if stopped."""
+    name = None
+
+    def __init__(self, clock=None):
+        self.clock = clock or SYSTEM_CLOCK
+        self.stats = WaitStats()
+
+    def wait_until(self, target_time, stop_event):
+        if not self._wait(target_time, stop_event):
+            return False
+        self.stats.add(self.clock.now() - target_time)
+        return True
+
+    def _wait(self, target_time, stop_event):
+        raise NotImplementedError
+
+
+class HybridSpinWait(WaitStrategy):
+    """Short sleeps until 2 ms out, then busy-spin. Precise, but pegs a core."""
+    name = 'hybrid'
+
+    def _wait(self, target_time, stop_event):
+        now, sleep = self.clock.now, self.clock.sleep
+        while now() < target_time:
+            if stop_event.is_set():
+                return False
+            diff = target_time - now()
+            if diff > 0.002:
+                sleep(0.001)
+        return True
+
+
+class DeadlineWait(WaitStrategy):
+    """Absolute-deadline clock_nanosleep, then a short final spin.
+
+    Sleeping to an absolute deadline avoids the drift of relative sleeps;
+    the spin only covers `spin` seconds of kernel wake-up latency.
+    """
+    name = 'deadline'
+
+    def __init__(self, clock=None, spin=0.0002):
+        super().__init__(clock)
+        self.spin = spin
+        # perf_counter() and CLOCK_MONOTONIC share a timebase on Linux, but
+        # measure the offset rather than assume it
+        if _clock_nanosleep is not None:
+            self._offset = time.clock_gettime(CLOCK_MONOTONIC) - time.perf_counter()
+
+    def _sleep_until(self, deadline):
+        if _clock_nanosleep is None:
+            time.sleep(max(0.0, deadline - time.perf_counter()))
+            return
+        absolute = deadline + self._offset
+        sec = int(absolute)
+        ts = _timespec(sec, int((absolute - sec) * 1e9))
+        _clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME, ctypes.byref(ts), None)
+
+    def _wait(self, target_time, stop_event):
+        clock = self.clock.now
+        wake = target_time - self.spin
+        while True:
+            if stop_event.is_set():
+                return False
+            now = clock()
+            if now >= wake:
+                break
+            self._sleep_until(min(wake, now + STOP_POLL))
+        while clock() < target_time:
+            pass
+        return True
+
+
+class SleepWait(WaitStrategy):
+    """Plain sleeps with no spin: near-idle CPU, kernel-slack precision.
+
+    The only strategy that works on a VirtualClock, since it never spins.
+    """
+    name = 'sleep'
+
+    def _wait(self, target_time, stop_event):
+        now, sleep = self.clock.now, self.clock.sleep
+        while True:
+            if stop_event.is_set():
+                return False
+            remaining = target_time - now()
+            if remaining <= 0:
+                return True
+            sleep(min(remaining, STOP_POLL))
+
+
+WAIT_STRATEGIES = {cls.name: cls for cls in (HybridSpinWait, DeadlineWait, SleepWait)}
+
+
+def make_wait_strategy(name, clock=None):
+    if isinstance(name, WaitStrategy):
+        return name
+    if clock is not None and clock.virtual:
+        # Spinning on a simulated clock would never see time move
+        name = SleepWait.name
+    try:
+        return WAIT_STRATEGIES[name](clock)
+    except KeyError:
+        raise ValueError(f"Unknown wait strategy: {name!r} (choose from {', '.join(WAIT_STRATEGIES)})")